@@ -1,7 +1,8 @@
-import sqlite3
 import functools
 from datetime import datetime 
 
+from db_connection import default_pool
+
 def log_queries(func):
     """
     A decorator that logs the SQL query passed to the decorated function.
@@ -24,12 +25,10 @@ def log_queries(func):
 # The rest of the provided code
 @log_queries
 def fetch_all_users(query):
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    cursor.execute(query)
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    with default_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query)
+        return cursor.fetchall()
 
 # fetch users while logging the query
 if __name__ == "__main__":
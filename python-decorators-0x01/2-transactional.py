@@ -1,32 +1,27 @@
-import sqlite3
 import functools
 
-
-def with_db_connection(func):
-## Decorator to handle opening and closing database connections
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        conn = sqlite3.connect("users.db")
-        try:
-            result = func(conn, *args, **kwargs)
-        finally:
-            conn.close()
-        return result
-    return wrapper
+from db_cache import WRITE_ACTIONS, query_cache, track_tables
+from db_connection import with_db_connection
 
 
 def transactional(func):
-## Decorator to manage database transactions
+## Decorator to manage database transactions.
+## Cached query results that read a written table are dropped once the
+## transaction ends, whether it commits or rolls back.
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
-        try:
-            result = func(conn, *args, **kwargs)
-            conn.commit()  # commit if successful
-            return result
-        except Exception as e:
-            conn.rollback()  # rollback on failure
-            print(f"[Transaction Rolled Back] Error: {e}")
-            raise
+        with track_tables(conn, WRITE_ACTIONS) as written:
+            try:
+                result = func(conn, *args, **kwargs)
+                conn.commit()  # commit if successful
+                return result
+            except Exception as e:
+                conn.rollback()  # rollback on failure
+                print(f"[Transaction Rolled Back] Error: {e}")
+                raise
+            finally:
+                if written:
+                    query_cache.invalidate_tables(written)
     return wrapper
 
 
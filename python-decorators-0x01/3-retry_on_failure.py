@@ -2,17 +2,7 @@ import sqlite3
 import functools
 import time
 
-def with_db_connection(func):
-## Decorator to handle opening and closing database connections
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        conn = sqlite3.connect("users.db")
-        try:
-            result = func(conn, *args, **kwargs)
-        finally:
-            conn.close()
-        return result
-    return wrapper
+from db_connection import with_db_connection
 
 
 def retry_on_failure(retries=3, delay=2):
@@ -1,49 +1,54 @@
 import sqlite3
 import functools
-import time
 
-# simple in-memory query cache
-query_cache = {}
+from db_cache import READ_ACTIONS, cache_key, query_cache, track_tables
+from db_connection import with_db_connection
 
+_MISSING = object()
 
-def with_db_connection(func):
-## Decorator to handle opening and closing database connections
-  
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        conn = sqlite3.connect("users.db")
-        try:
-            result = func(conn, *args, **kwargs)
-        finally:
-            conn.close()
-        return result
-    return wrapper
 
+def cache_query(func=None, *, ttl=None, cache=None):
+## Decorator to cache query results keyed on normalized SQL plus its bound
+## parameters. Concurrent misses on one key run the query only once.
+## Usable bare (@cache_query) or with options (@cache_query(ttl=60)).
+    if func is None:
+        return functools.partial(cache_query, ttl=ttl, cache=cache)
+    cache = query_cache if cache is None else cache
 
-def cache_query(func):
-## Decorator to cache query results based on SQL query string
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         query = kwargs.get("query", None)
         if query is None and len(args) > 1:  # skip conn, get query from second arg
             query = args[1]
+        params = kwargs.get("params", None)
+        if params is None and len(args) > 2:
+            params = args[2]
+        key = cache_key(query, params)
 
-        if query in query_cache:
+        result = cache.get(key, _MISSING)
+        if result is not _MISSING:
             print(f"[CACHE HIT] Returning cached result for: {query}")
-            return query_cache[query]
+            return result
 
         print(f"[CACHE MISS] Executing query: {query}")
-        result = func(*args, **kwargs)
-        query_cache[query] = result
-        return result
+        conn = kwargs.get("conn", args[0] if args else None)
+
+        def loader():
+            if not isinstance(conn, sqlite3.Connection):
+                return func(*args, **kwargs), None
+            # tag the entry with the tables the query reads
+            with track_tables(conn, READ_ACTIONS) as tables:
+                return func(*args, **kwargs), tables
+
+        return cache.load(key, loader, ttl)
     return wrapper
 
 
 @with_db_connection
 @cache_query
-def fetch_users_with_cache(conn, query):
+def fetch_users_with_cache(conn, query, params=()):
     cursor = conn.cursor()
-    cursor.execute(query)
+    cursor.execute(query, params)
     return cursor.fetchall()
 
 
@@ -56,3 +61,4 @@ if __name__ == "__main__":
     ## Second call -> returns from cache
     users_again = fetch_users_with_cache(query="SELECT * FROM users")
     print(users_again)
+    print(query_cache.stats())
@@ -0,0 +1,454 @@
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+MAX_ENTRIES = 256
+MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_TTL = 300
+ANY_TABLE = "*"
+# set to a file path to share cached results between processes on a host
+QUERY_CACHE_DB = os.environ.get("QUERY_CACHE_DB")
+TOUCH_INTERVAL = 1.0  # seconds between LRU timestamp writes for one entry
+
+_MISSING = object()
+
+# string literals and quoted identifiers are kept verbatim by normalize_sql
+_SQL_TOKEN = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])|\s+""")
+
+
+def approx_size(value):
+## Rough memory footprint of a query result (rows of tuples of scalars)
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_size(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    return size
+
+
+def normalize_sql(query):
+## Collapse runs of whitespace outside quotes and drop a trailing semicolon,
+## so formatting differences don't produce separate cache entries
+    query = _SQL_TOKEN.sub(lambda m: m.group(1) or " ", query).strip()
+    return query.rstrip(";").rstrip()
+
+
+def _freeze(params):
+## Hashable form of bound parameters (sequence or named mapping)
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in params.items()))
+    if isinstance(params, (list, tuple)):
+        return tuple(_freeze(p) for p in params)
+    return params
+
+
+def cache_key(query, params=None):
+## Cache key from normalized SQL plus its bound parameters
+    return (normalize_sql(query), _freeze(params))
+
+
+class _Flight:
+## One in-progress load that concurrent callers of the same key wait on
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class QueryCache:
+## Query result cache bounded by entry count and approximate bytes,
+## with LRU eviction, per-entry TTL and hit/miss/eviction counters.
+## Entries are tagged with the tables they read so writes can drop them.
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES,
+                 ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # key -> (result, size, expires_at)
+        self._tags = {}  # key -> tables read
+        self._keys_by_table = {}  # table -> keys that read it
+        self._flights = {}  # key -> _Flight for loads in progress
+        self._generation = 0  # bumped by every invalidation
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        ## Return the cached result and mark it recently used
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, result, ttl=None, tables=None, generation=None):
+        ## Store a result, evicting least recently used entries to fit.
+        ## Results with unknown tables (None) depend on every table. When
+        ## generation is given, the result is dropped if an invalidation
+        ## happened since that generation was read.
+        size = approx_size(result)
+        if tables is None:
+            tables = frozenset({ANY_TABLE})
+        else:
+            tables = frozenset(t.lower() for t in tables)
+        if size > self.max_bytes:
+            return False
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (result, size, expires_at)
+            self._tags[key] = tables
+            for table in tables:
+                self._keys_by_table.setdefault(table, set()).add(key)
+            self.total_bytes += size
+            while (len(self._entries) > self.max_entries
+                   or self.total_bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def load(self, key, loader, ttl=None):
+        ## Single-flight miss handling: the first caller runs loader(), which
+        ## returns (result, tables); concurrent callers for the same key wait
+        ## for that result (or exception) instead of running the query again
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            # a previous leader may have stored it since our miss
+            result = self._peek(key)
+            if result is _MISSING:
+                generation = self._current_generation()
+                result, tables = loader()
+                self.set(key, result, ttl, tables, generation)
+            flight.result = result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return result
+
+    def _peek(self, key):
+        ## Cached result without touching the hit/miss counters
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] <= time.monotonic():
+                return _MISSING
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _current_generation(self):
+        with self._lock:
+            return self._generation
+
+    def _remove(self, key):
+        ## Drop an entry and release its bytes (lock must be held)
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+        for table in self._tags.pop(key):
+            keys = self._keys_by_table[table]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_table[table]
+
+    def invalidate_tables(self, tables):
+        ## Drop the entries that read any of the given tables
+        tables = {t.lower() for t in tables} | {ANY_TABLE}
+        with self._lock:
+            keys = set()
+            for table in tables:
+                keys |= self._keys_by_table.get(table, set())
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            self._generation += 1
+        return len(keys)
+
+    def clear(self):
+        ## Drop every entry but keep the counters
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._keys_by_table.clear()
+            self.total_bytes = 0
+            self._generation += 1
+
+    def stats(self):
+        ## Snapshot of the cache counters
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedQueryCache(QueryCache):
+## QueryCache stored in a local SQLite file, so every worker process on the
+## host reads the same entries and they survive restarts. Results are stored
+## as zlib-compressed pickles keyed by a hash of the cache key; only point it
+## at a file that untrusted users cannot write. Hit/miss counters and
+## single-flight loading are per process.
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key_hash BLOB PRIMARY KEY,
+            result BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            expires_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+        CREATE TABLE IF NOT EXISTS entry_tables (
+            table_name TEXT NOT NULL,
+            key_hash BLOB NOT NULL,
+            PRIMARY KEY (table_name, key_hash)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS entry_tables_key ON entry_tables (key_hash);
+        CREATE TABLE IF NOT EXISTS meta (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta VALUES ('generation', 0);
+    """
+
+    def __init__(self, path, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES,
+                 ttl=DEFAULT_TTL, timeout=5.0):
+        super().__init__(max_entries, max_bytes, ttl)
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        ## One connection per thread, reopened after a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        ## Write transaction that takes the file lock up front
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _hash(key):
+        return hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+
+    def _fetch(self, key_hash):
+        ## Stored result for a key hash, touching its LRU timestamp
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT result, expires_at, last_used FROM entries"
+            " WHERE key_hash = ?", (key_hash,)).fetchone()
+        now = time.time()
+        if row is None or row[1] <= now:
+            return _MISSING
+        if now - row[2] > TOUCH_INTERVAL:
+            conn.execute("UPDATE entries SET last_used = ? WHERE key_hash = ?",
+                         (now, key_hash))
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def get(self, key, default=None):
+        result = self._fetch(self._hash(key))
+        with self._lock:
+            if result is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return result
+
+    def _peek(self, key):
+        return self._fetch(self._hash(key))
+
+    def _current_generation(self):
+        return self._connect().execute(
+            "SELECT value FROM meta WHERE name = 'generation'").fetchone()[0]
+
+    def set(self, key, result, ttl=None, tables=None, generation=None):
+        if tables is None:
+            tables = {ANY_TABLE}
+        blob = zlib.compress(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        if len(blob) > self.max_bytes:
+            return False
+        key_hash = self._hash(key)
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._transaction() as conn:
+            if (generation is not None
+                    and generation != self._current_generation()):
+                return False
+            conn.execute("DELETE FROM entry_tables WHERE key_hash = ?",
+                         (key_hash,))
+            conn.execute("REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                         (key_hash, blob, len(blob), expires_at, now))
+            conn.executemany("INSERT INTO entry_tables VALUES (?, ?)",
+                             [(t.lower(), key_hash) for t in set(tables)])
+            self._evict(conn, now)
+        return True
+
+    def _evict(self, conn, now):
+        ## Drop expired entries, then least recently used ones over the limits
+        expired = conn.execute(
+            "DELETE FROM entries WHERE expires_at <= ?", (now,)).rowcount
+        evicted = 0
+        count, total = conn.execute(
+            "SELECT count(*), coalesce(sum(size), 0) FROM entries").fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            for key_hash, size in conn.execute(
+                    "SELECT key_hash, size FROM entries"
+                    " ORDER BY last_used").fetchall():
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM entries WHERE key_hash = ?",
+                             (key_hash,))
+                count, total = count - 1, total - size
+                evicted += 1
+        if expired or evicted:
+            conn.execute("DELETE FROM entry_tables WHERE key_hash NOT IN"
+                         " (SELECT key_hash FROM entries)")
+        with self._lock:
+            self.expirations += expired
+            self.evictions += evicted
+
+    def invalidate_tables(self, tables):
+        tables = {t.lower() for t in tables} | {ANY_TABLE}
+        marks = ",".join("?" * len(tables))
+        with self._transaction() as conn:
+            keys = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT key_hash FROM entry_tables"
+                f" WHERE table_name IN ({marks})", tuple(tables))]
+            conn.executemany("DELETE FROM entries WHERE key_hash = ?",
+                             [(k,) for k in keys])
+            conn.executemany("DELETE FROM entry_tables WHERE key_hash = ?",
+                             [(k,) for k in keys])
+            conn.execute(
+                "UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+        with self._lock:
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM entry_tables")
+            conn.execute(
+                "UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+
+    def stats(self):
+        count, total = self._connect().execute(
+            "SELECT count(*), coalesce(sum(size), 0) FROM entries").fetchone()
+        with self._lock:
+            return {
+                "entries": count,
+                "bytes": total,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def __len__(self):
+        return self._connect().execute(
+            "SELECT count(*) FROM entries").fetchone()[0]
+
+
+_trackers = {}  # id(conn) -> active (actions, tables) pairs
+_trackers_lock = threading.Lock()
+
+
+@contextmanager
+def track_tables(conn, actions):
+## Collect the tables a block of statements touches on a sqlite3
+## connection, using an authorizer callback (called when each statement
+## is prepared). actions is a set of sqlite3 action codes; blocks may nest.
+    tables = set()
+    tracker = (actions, tables)
+    with _trackers_lock:
+        active = _trackers.setdefault(id(conn), [])
+        active.append(tracker)
+
+    def authorizer(action, arg1, arg2, db_name, trigger):
+        if arg1:
+            for wanted, seen in active:
+                if action in wanted:
+                    seen.add(arg1.lower())
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorizer)
+    try:
+        yield tables
+    finally:
+        with _trackers_lock:
+            active.remove(tracker)
+            if not active:
+                del _trackers[id(conn)]
+                conn.set_authorizer(None)
+
+
+READ_ACTIONS = {sqlite3.SQLITE_READ}
+WRITE_ACTIONS = {sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE,
+                 sqlite3.SQLITE_DELETE, sqlite3.SQLITE_DROP_TABLE,
+                 sqlite3.SQLITE_ALTER_TABLE}
+
+# query cache shared by cache_query and transactional: in memory, or in
+# QUERY_CACHE_DB when set so all worker processes share it
+if QUERY_CACHE_DB:
+    query_cache = SharedQueryCache(QUERY_CACHE_DB)
+else:
+    query_cache = QueryCache()
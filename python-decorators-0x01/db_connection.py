@@ -0,0 +1,139 @@
+import sqlite3
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DB_PATH = "users.db"
+POOL_SIZE = 5
+IDLE_TIMEOUT = 60  # seconds an unused connection stays open
+ACQUIRE_TIMEOUT = 5  # seconds to wait for a free connection
+
+
+class ConnectionPool:
+## Thread-safe pool of persistent sqlite3 connections. At most max_size are
+## open at once; idle ones are closed after idle_timeout. Returned connections
+## are rolled back so no transaction leaks to the next caller.
+## on_data_change(), if given, runs on checkout when PRAGMA data_version shows
+## another connection or process committed since this one's last checkout.
+    def __init__(self, path=DB_PATH, max_size=POOL_SIZE,
+                 idle_timeout=IDLE_TIMEOUT, timeout=ACQUIRE_TIMEOUT,
+                 on_data_change=None):
+        self.path = path
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.on_data_change = on_data_change
+        self._idle = []  # (conn, returned_at), most recent last
+        self._versions = {}  # conn -> data_version at its last checkout
+        self._open = 0
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        ## Check out a connection, opening one if the pool isn't full
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            self._after_fork()
+            self._close_idle()
+            while not self._idle and self._open >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(
+                        f"connection pool exhausted ({self.max_size} in use)")
+                self._cond.wait(remaining)
+            if self._idle:
+                conn, _ = self._idle.pop()
+            else:
+                conn = None
+                self._open += 1
+        if conn is None:
+            try:
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+            except BaseException:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+        if self.on_data_change is not None:
+            # Compared checkout to checkout, so commits by others that land
+            # while this connection is checked out are caught next time.
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            last = self._versions.get(conn)
+            self._versions[conn] = version
+            if last is not None and version != last:
+                self.on_data_change()
+        return conn
+
+    def release(self, conn):
+        ## Reset a connection and return it to the pool (or close it if broken)
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._cond:
+            if os.getpid() != self._pid:
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn):
+        conn.close()
+        with self._cond:
+            self._versions.pop(conn, None)
+            self._open -= 1
+            self._cond.notify()
+
+    def _close_idle(self):
+        ## Close connections idle longer than idle_timeout (lock must be held)
+        cutoff = time.monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][1] < cutoff:
+            conn, _ = self._idle.pop(0)
+            conn.close()
+            self._versions.pop(conn, None)
+            self._open -= 1
+
+    def _after_fork(self):
+        ## A forked child must not share the parent's connections
+        ## (lock must be held)
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._idle, self._versions, self._open = [], {}, 0
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        ## Close every idle connection
+        with self._cond:
+            for conn, _ in self._idle:
+                conn.close()
+                self._open -= 1
+            self._idle.clear()
+            self._versions.clear()
+
+
+# shared by every with_db_connection in this directory
+default_pool = ConnectionPool()
+
+
+def with_db_connection(func=None, *, pool=None):
+## Decorator that passes a pooled connection as the first argument.
+## Usable bare (@with_db_connection) or with a pool (@with_db_connection(pool=p)).
+    if func is None:
+        return functools.partial(with_db_connection, pool=pool)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with (pool or default_pool).connection() as conn:
+            return func(conn, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Tests for the query result cache in db_cache.py.
+"""
+import importlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from db_cache import QueryCache, SharedQueryCache, approx_size, cache_key
+
+
+class TestQueryCache(unittest.TestCase):
+    """
+    Tests the bounds, LRU eviction, TTL and counters of QueryCache.
+    """
+
+    def test_get_and_set(self):
+        """
+        Test that a stored result comes back and counts as a hit, and that
+        a missing key returns the default and counts as a miss.
+        """
+        cache = QueryCache()
+        cache.set("SELECT 1", [(1,)])
+        self.assertEqual(cache.get("SELECT 1"), [(1,)])
+        self.assertEqual(cache.get("SELECT 2", "missing"), "missing")
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['bytes'], approx_size([(1,)]))
+
+    def test_evicts_least_recently_used_entry(self):
+        """
+        Test that going over max_entries evicts the least recently used
+        entry, where a get counts as a use.
+        """
+        cache = QueryCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("b", None), None)
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_evicts_to_fit_max_bytes(self):
+        """
+        Test that entries are evicted until the total size fits max_bytes,
+        and that a result larger than max_bytes is not cached at all.
+        """
+        row = [("x" * 100,)]
+        size = approx_size(row)
+        cache = QueryCache(max_bytes=2 * size)
+        for key in ("a", "b", "c"):
+            self.assertTrue(cache.set(key, row))
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.stats()['bytes'], 2 * size)
+        self.assertFalse(cache.set("big", [row * 10]))
+        self.assertEqual(cache.get("big", None), None)
+
+    def test_expires_after_ttl(self):
+        """
+        Test that an entry expires after its ttl and is then removed.
+        """
+        cache = QueryCache(ttl=10)
+        with patch('db_cache.time.monotonic', return_value=100.0):
+            cache.set("default", 1)
+            cache.set("short", 2, ttl=1)
+        with patch('db_cache.time.monotonic', return_value=105.0):
+            self.assertEqual(cache.get("default"), 1)
+            self.assertEqual(cache.get("short", None), None)
+        with patch('db_cache.time.monotonic', return_value=111.0):
+            self.assertEqual(cache.get("default", None), None)
+        self.assertEqual(cache.stats()['expirations'], 2)
+        self.assertEqual(len(cache), 0)
+
+    def test_clear(self):
+        """
+        Test that clear drops every entry but keeps the counters.
+        """
+        cache = QueryCache()
+        cache.set("a", 1)
+        cache.get("a")
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()['bytes'], 0)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+
+class TestCacheKey(unittest.TestCase):
+    """
+    Tests that cache keys normalize SQL and include bound parameters.
+    """
+
+    def test_normalizes_whitespace_and_semicolon(self):
+        """
+        Test that formatting differences outside quotes share one key.
+        """
+        self.assertEqual(cache_key("SELECT *\n  FROM users ;"),
+                         cache_key("SELECT * FROM users"))
+
+    def test_keeps_quoted_text(self):
+        """
+        Test that whitespace inside string literals still matters.
+        """
+        self.assertNotEqual(
+            cache_key("SELECT * FROM users WHERE name = 'a  b'"),
+            cache_key("SELECT * FROM users WHERE name = 'a b'"))
+
+    def test_includes_parameters(self):
+        """
+        Test that positional and named parameters are part of the key, and
+        that named ones don't depend on their order.
+        """
+        query = "SELECT * FROM users WHERE id = ?"
+        self.assertNotEqual(cache_key(query, (1,)), cache_key(query, (2,)))
+        self.assertEqual(cache_key(query, [1]), cache_key(query, (1,)))
+        self.assertEqual(cache_key(query, {'a': 1, 'b': [2]}),
+                         cache_key(query, {'b': (2,), 'a': 1}))
+
+
+class TestSingleFlight(unittest.TestCase):
+    """
+    Tests that QueryCache.load runs a missed query once for all callers.
+    """
+
+    def run_concurrently(self, cache, loader, callers=8):
+        """Calls cache.load from several threads while the first loader
+        call is held open, and returns what each caller got."""
+        started = threading.Event()
+        release = threading.Event()
+        outcomes = [None] * callers
+
+        def held_loader():
+            started.set()
+            release.wait()
+            return loader()
+
+        def call(index):
+            try:
+                outcomes[index] = cache.load("key", held_loader)
+            except Exception as error:
+                outcomes[index] = error
+
+        threads = [threading.Thread(target=call, args=(index,))
+                   for index in range(callers)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_loads_once(self):
+        """
+        Test that concurrent misses on one key run the loader once and all
+        get its result, which is then cached.
+        """
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return [(1,)], {"users"}
+
+        cache = QueryCache()
+        outcomes = self.run_concurrently(cache, loader)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [[(1,)]] * 8)
+        self.assertEqual(cache.get("key"), [(1,)])
+
+    def test_error_reaches_every_waiter(self):
+        """
+        Test that a failed load raises in every caller and caches nothing.
+        """
+        calls = []
+
+        def loader():
+            calls.append(1)
+            raise sqlite3.OperationalError("database is locked")
+
+        cache = QueryCache()
+        outcomes = self.run_concurrently(cache, loader)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(outcome, sqlite3.OperationalError)
+                            for outcome in outcomes))
+        self.assertEqual(len(cache), 0)
+
+    def test_invalidation_during_load_skips_caching(self):
+        """
+        Test that a result loaded across a table invalidation is returned
+        but not cached, since it may predate the write.
+        """
+        cache = QueryCache()
+
+        def loader():
+            cache.invalidate_tables({"users"})
+            return [(1,)], {"users"}
+
+        self.assertEqual(cache.load("key", loader), [(1,)])
+        self.assertEqual(len(cache), 0)
+
+
+class TestSharedQueryCache(unittest.TestCase):
+    """
+    Tests SharedQueryCache instances sharing one cache file, as separate
+    worker processes would.
+    """
+
+    def setUp(self):
+        """Points the cache at a file in a temporary directory."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.db")
+
+    def test_entries_persist_across_instances(self):
+        """
+        Test that an entry stored by one instance is read by another one
+        opened on the same file.
+        """
+        SharedQueryCache(self.path).set("key", [(1, "a")], tables={"users"})
+        other = SharedQueryCache(self.path)
+        self.assertEqual(other.get("key"), [(1, "a")])
+        self.assertEqual(len(other), 1)
+
+    def test_evicts_least_recently_used_entry(self):
+        """
+        Test that going over max_entries evicts by last_used, where a get
+        counts as a use, and that the entry's table tags go with it.
+        """
+        cache = SharedQueryCache(self.path, max_entries=2)
+        with patch('db_cache.time.time', return_value=100.0):
+            cache.set("a", 1, tables={"users"})
+        with patch('db_cache.time.time', return_value=101.0):
+            cache.set("b", 2, tables={"orders"})
+        with patch('db_cache.time.time', return_value=103.0):
+            self.assertEqual(cache.get("a"), 1)
+        with patch('db_cache.time.time', return_value=104.0):
+            cache.set("c", 3, tables={"users"})
+            self.assertEqual(cache.get("b", None), None)
+            self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        tables = cache._connect().execute(
+            "SELECT DISTINCT table_name FROM entry_tables").fetchall()
+        self.assertEqual(tables, [("users",)])
+
+    def test_evicts_to_fit_max_bytes(self):
+        """
+        Test that the oldest entries are evicted until the stored size
+        fits max_bytes.
+        """
+        cache = SharedQueryCache(self.path)
+        cache.set("probe", [("x" * 100,)])
+        size = cache.stats()['bytes']
+        cache.clear()
+
+        cache = SharedQueryCache(self.path, max_bytes=2 * size)
+        for now, key in enumerate(("a", "b", "c")):
+            with patch('db_cache.time.time', return_value=100.0 + now):
+                cache.set(key, [("x" * 100,)])
+        with patch('db_cache.time.time', return_value=110.0):
+            self.assertEqual(cache.get("a", None), None)
+            self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.stats()['bytes'], 2 * size)
+
+    def test_invalidation_reaches_other_instances(self):
+        """
+        Test that invalidate_tables on one instance drops the entry another
+        instance sees, and leaves entries on other tables alone.
+        """
+        reader = SharedQueryCache(self.path)
+        writer = SharedQueryCache(self.path)
+        reader.set("users", [(1,)], tables={"users"})
+        reader.set("orders", [(2,)], tables={"orders"})
+        self.assertEqual(writer.invalidate_tables({"USERS"}), 1)
+        self.assertEqual(reader.get("users", None), None)
+        self.assertEqual(reader.get("orders"), [(2,)])
+
+    def test_invalidation_during_load_skips_caching(self):
+        """
+        Test that a load overlapping an invalidation from another instance
+        returns its result but does not store it.
+        """
+        cache = SharedQueryCache(self.path)
+        other = SharedQueryCache(self.path)
+
+        def loader():
+            other.invalidate_tables({"users"})
+            return [(1,)], {"users"}
+
+        self.assertEqual(cache.load("key", loader), [(1,)])
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(other.get("key", None), None)
+
+    def test_reconnects_after_fork(self):
+        """
+        Test that a process with a new pid opens its own connection rather
+        than reusing the parent's.
+        """
+        cache = SharedQueryCache(self.path)
+        parent = cache._connect()
+        with patch('db_cache.os.getpid', return_value=-1):
+            child = cache._connect()
+        self.assertIsNot(child, parent)
+        self.assertEqual(child.execute("SELECT count(*) FROM entries")
+                         .fetchone(), (0,))
+
+
+class TestCacheQuery(unittest.TestCase):
+    """
+    Tests the cache_query decorator against an in-memory database.
+    """
+
+    def setUp(self):
+        """Creates a small users table and a private cache."""
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute("CREATE TABLE users (id INTEGER, name TEXT)")
+        self.conn.executemany("INSERT INTO users VALUES (?, ?)",
+                              [(1, "a"), (2, "b")])
+        self.conn.execute("CREATE TABLE orders (id INTEGER, user_id INTEGER)")
+        self.conn.execute("INSERT INTO orders VALUES (1, 1)")
+        self.conn.commit()
+        self.cache = QueryCache()
+        cache_query = importlib.import_module('4-cache_query').cache_query
+
+        @cache_query(cache=self.cache)
+        def fetch(conn, query, params=()):
+            return conn.execute(query, params).fetchall()
+        self.fetch = fetch
+
+        transactional_module = importlib.import_module('2-transactional')
+        patcher = patch.object(transactional_module, 'query_cache',
+                               self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        @transactional_module.transactional
+        def rename(conn, user_id, name, fail=False):
+            conn.execute("UPDATE users SET name = ? WHERE id = ?",
+                         (name, user_id))
+            if fail:
+                raise sqlite3.IntegrityError("rejected")
+        self.rename = rename
+
+    def tearDown(self):
+        """Closes the database."""
+        self.conn.close()
+
+    def test_parameters_select_the_entry(self):
+        """
+        Test that the same query with other parameters is a separate
+        entry, and that reformatted SQL hits the cached one.
+        """
+        query = "SELECT name FROM users WHERE id = ?"
+        with patch('builtins.print'):
+            self.assertEqual(self.fetch(self.conn, query, (1,)), [("a",)])
+            self.assertEqual(self.fetch(self.conn, query, (2,)), [("b",)])
+            self.assertEqual(self.fetch(self.conn, query + " ;", (1,)),
+                             [("a",)])
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_commit_invalidates_written_table(self):
+        """
+        Test that a committed UPDATE users evicts the cached users query,
+        so the next call sees the new value, while a cached query on an
+        unrelated table survives.
+        """
+        users = "SELECT name FROM users WHERE id = ?"
+        orders = "SELECT id FROM orders"
+        with patch('builtins.print'):
+            self.assertEqual(self.fetch(self.conn, users, (1,)), [("a",)])
+            self.assertEqual(self.fetch(self.conn, orders), [(1,)])
+            self.rename(self.conn, 1, "z")
+            self.assertEqual(self.fetch(self.conn, users, (1,)), [("z",)])
+            self.assertEqual(self.fetch(self.conn, orders), [(1,)])
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_rollback_also_invalidates(self):
+        """
+        Test that a rolled-back write still drops the cached users query.
+        """
+        users = "SELECT name FROM users WHERE id = ?"
+        with patch('builtins.print'):
+            self.fetch(self.conn, users, (1,))
+            with self.assertRaises(sqlite3.IntegrityError):
+                self.rename(self.conn, 1, "z", fail=True)
+            self.assertEqual(self.fetch(self.conn, users, (1,)), [("a",)])
+        self.assertEqual(self.cache.stats()['invalidations'], 1)
+        self.assertEqual(self.cache.stats()['hits'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
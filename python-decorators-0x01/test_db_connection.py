@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared sqlite3 connection pool in db_connection.py.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from db_connection import ConnectionPool, with_db_connection
+
+
+class PoolTestCase(unittest.TestCase):
+    """
+    Base case that gives every test a fresh users database file.
+    """
+
+    def setUp(self):
+        """Creates a users table in a temporary database file."""
+        handle, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        with sqlite3.connect(self.path) as conn:
+            conn.execute("CREATE TABLE users (id INTEGER, email TEXT)")
+            conn.execute("INSERT INTO users VALUES (1, 'a@example.com')")
+        conn.close()
+
+    def pool(self, **kwargs):
+        """Returns a pool over the test database, closed after the test."""
+        pool = ConnectionPool(self.path, **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def write(self, email):
+        """Commits a change from a connection outside the pool."""
+        conn = sqlite3.connect(self.path)
+        conn.execute("UPDATE users SET email = ? WHERE id = 1", (email,))
+        conn.commit()
+        conn.close()
+
+
+class TestConnectionPool(PoolTestCase):
+    """
+    Tests reuse, size limit, idle timeout and reset-on-return.
+    """
+
+    def test_reuses_connections(self):
+        """
+        Test that a returned connection is handed out again.
+        """
+        pool = self.pool()
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            self.assertIs(second, first)
+
+    def test_waits_then_fails_when_exhausted(self):
+        """
+        Test that a checkout waits for a free connection, and raises
+        OperationalError once timeout passes with none returned.
+        """
+        pool = self.pool(max_size=1, timeout=0.2)
+        held = pool.acquire()
+        with self.assertRaises(sqlite3.OperationalError):
+            pool.acquire()
+
+        threading.Timer(0.05, pool.release, args=(held,)).start()
+        self.assertIs(pool.acquire(), held)
+        pool.release(held)
+
+    def test_closes_idle_connections(self):
+        """
+        Test that connections idle longer than idle_timeout are closed.
+        """
+        pool = self.pool(idle_timeout=0.05)
+        with pool.connection() as stale:
+            pass
+        time.sleep(0.1)
+        with pool.connection() as fresh:
+            self.assertIsNot(fresh, stale)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            stale.execute("SELECT 1")
+
+    def test_rolls_back_on_return(self):
+        """
+        Test that an uncommitted transaction is rolled back on return, so
+        it never leaks to the next caller.
+        """
+        pool = self.pool(max_size=1)
+        with pool.connection() as conn:
+            conn.execute("UPDATE users SET email = 'x' WHERE id = 1")
+            self.assertTrue(conn.in_transaction)
+        with pool.connection() as conn:
+            self.assertFalse(conn.in_transaction)
+            self.assertEqual(
+                conn.execute("SELECT email FROM users").fetchone(),
+                ("a@example.com",))
+
+    def test_with_db_connection(self):
+        """
+        Test that the decorator passes a pooled connection first.
+        """
+        pool = self.pool()
+
+        @with_db_connection(pool=pool)
+        def get_email(conn, user_id):
+            return conn.execute("SELECT email FROM users WHERE id = ?",
+                                (user_id,)).fetchone()[0]
+
+        self.assertEqual(get_email(user_id=1), "a@example.com")
+        self.assertEqual(len(pool._idle), 1)
+
+
+class TestDataVersion(PoolTestCase):
+    """
+    Tests that on_data_change sees commits made by other connections.
+    """
+
+    def test_write_while_idle(self):
+        """
+        Test that a commit made while the connection sits in the pool is
+        reported at the next checkout.
+        """
+        changed = Mock()
+        pool = self.pool(max_size=1, on_data_change=changed)
+        with pool.connection():
+            pass
+        self.write("idle@example.com")
+        with pool.connection():
+            pass
+        changed.assert_called_once_with()
+
+    def test_write_during_checkout(self):
+        """
+        Test that a commit made while the connection is checked out is
+        reported at the next checkout, not counted as already seen.
+        """
+        changed = Mock()
+        pool = self.pool(max_size=1, on_data_change=changed)
+        with pool.connection() as conn:
+            conn.execute("SELECT 1").fetchone()
+            self.write("busy@example.com")
+        with pool.connection():
+            pass
+        changed.assert_called_once_with()
+
+    def test_own_write_is_not_a_change(self):
+        """
+        Test that a connection's own commit does not fire the callback.
+        """
+        changed = Mock()
+        pool = self.pool(max_size=1, on_data_change=changed)
+        with pool.connection() as conn:
+            conn.execute("UPDATE users SET email = 'own' WHERE id = 1")
+            conn.commit()
+        with pool.connection():
+            pass
+        changed.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
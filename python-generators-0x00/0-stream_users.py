@@ -3,17 +3,39 @@
 import seed
 
 
-def stream_users():
+def stream_users(chunk_size=seed.STREAM_CHUNK_SIZE, resume_token=None,
+                 checkpoint=None, checkpoint_every=seed.CHECKPOINT_EVERY,
+                 row_format='dict'):
     """
     Generator that streams rows from the user_data table one by one.
-    Yields dict objects representing each user.
+    Yields dict objects representing each user, or the compact row_format
+    chosen from seed.ROW_FORMATS.
+    Rows are read from an unbuffered cursor chunk_size at a time, so peak
+    memory stays bounded by the chunk size, not by the table size.
+    A resume token (seed.encode_page_token of the last user_id handled)
+    restarts the scan right after that user. With a checkpoint store
+    (seed.FileCheckpoint or seed.SQLiteCheckpoint) the token is loaded from
+    it, saved every checkpoint_every rows and cleared once the scan ends.
     """
-    connection = seed.connect_to_prodev()
-    cursor = connection.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM user_data")
+    if resume_token is None and checkpoint is not None:
+        resume_token = checkpoint.load()
+    if resume_token is not None or checkpoint is not None:
+        last_seen = (seed.decode_page_token(resume_token)
+                     if resume_token else None)
+        sql, params = seed.build_select(keyset=True, after=last_seen)
+    else:
+        sql, params = seed.build_select()
 
-    for row in cursor:
-        yield row
+    with seed.pooled_connection() as connection:
+        cursor = seed.row_cursor(connection, row_format, buffered=False)
+        cursor.execute(sql, params)
+        count = 0
+        for row in seed.iter_rows(cursor, chunk_size, row_format):
+            yield row
+            count += 1
+            if checkpoint is not None and count % checkpoint_every == 0:
+                checkpoint.save(seed.encode_page_token(seed.row_user_id(row)))
+        cursor.close()
 
-    cursor.close()
-    connection.close()
+    if checkpoint is not None:
+        checkpoint.clear()
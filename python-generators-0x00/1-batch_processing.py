@@ -3,32 +3,65 @@
 import seed
 
 
-def stream_users_in_batches(batch_size):
+def stream_users_in_batches(batch_size, keyset=False, page_token=None,
+                            columns=None, where=None, row_format='dict',
+                            int_ages=False):
     """
     Generator that streams rows from user_data in batches of batch_size.
+    With keyset=True (or a page_token from seed.next_page_token) batches are
+    fetched with WHERE user_id > last_seen instead of OFFSET, so a full walk
+    of the table stays linear in its size.
+    columns and where (e.g. {'age__gt': 25}) are compiled into the query by
+    seed.build_select, so only matching rows and columns are transferred.
+    row_format picks dict rows (the default) or a compact format from
+    seed.ROW_FORMATS. int_ages=True returns ages as int, not Decimal.
     """
-    connection = seed.connect_to_prodev()
-    cursor = connection.cursor(dictionary=True)
+    with seed.pooled_connection() as connection:
+        cursor = seed.row_cursor(connection, row_format)
 
-    offset = 0
-    while True:
-        cursor.execute(f"SELECT * FROM user_data LIMIT {batch_size} OFFSET {offset}")
-        rows = cursor.fetchall()
-        if not rows:
-            break
-        yield rows
-        offset += batch_size
+        if keyset or page_token is not None:
+            last_seen = (seed.decode_page_token(page_token)
+                         if page_token else None)
+            while True:
+                rows = seed.fetch_page_after(cursor, batch_size, last_seen,
+                                             columns, where, row_format,
+                                             int_ages)
+                if not rows:
+                    break
+                yield rows
+                last_seen = seed.row_user_id(rows[-1])
+        else:
+            offset = 0
+            while True:
+                sql, params = seed.build_select(columns, where,
+                                                limit=batch_size,
+                                                offset=offset,
+                                                int_age=int_ages)
+                cursor.execute(sql, params)
+                rows = seed.convert_rows(cursor.fetchall(), row_format)
+                if not rows:
+                    break
+                yield rows
+                offset += batch_size
 
-    cursor.close()
-    connection.close()
+        cursor.close()
     return
 
 
-def batch_processing(batch_size):
+def batch_processing(batch_size, keyset=False, sink=None):
     """
     Process users in batches and print only those older than 25.
+    The age filter runs in the database, so younger users never leave it.
+    With a sink from sinks.py (JSON Lines, CSV or a callback) each batch is
+    serialized and written in one go instead of printed row by row.
     """
-    for batch in stream_users_in_batches(batch_size):
+    for batch in stream_users_in_batches(batch_size, keyset=keyset,
+                                         where={"age__gt": 25},
+                                         int_ages=True):
+        if sink is not None:
+            sink.write_batch(batch)
+            continue
         for user in batch:
-            if user["age"] > 25:
-                print(user)
+            print(user)
+    if sink is not None:
+        sink.flush()
@@ -3,24 +3,66 @@
 import seed
 
 
-def paginate_users(page_size, offset):
+def paginate_users(page_size, offset, row_format='dict'):
     """Fetches a single page of users from the database."""
-    connection = seed.connect_to_prodev()
-    cursor = connection.cursor(dictionary=True)
-    cursor.execute(f"SELECT * FROM user_data LIMIT {page_size} OFFSET {offset}")
-    rows = cursor.fetchall()
-    connection.close()
+    with seed.pooled_connection() as connection:
+        cursor = seed.row_cursor(connection, row_format)
+        cursor.execute(*seed.build_select(limit=page_size, offset=offset))
+        rows = seed.convert_rows(cursor.fetchall(), row_format)
+        cursor.close()
     return rows
 
 
-def lazy_pagination(page_size):
+def paginate_users_after(page_size, page_token=None, row_format='dict'):
+    """
+    Fetches the page of users that follows page_token (keyset pagination).
+    Returns the rows and the token for the page after them, which is None
+    once the table is exhausted.
+    """
+    last_seen = seed.decode_page_token(page_token) if page_token else None
+    with seed.pooled_connection() as connection:
+        cursor = seed.row_cursor(connection, row_format)
+        rows = seed.fetch_page_after(cursor, page_size, last_seen,
+                                     row_format=row_format)
+        cursor.close()
+    return rows, seed.next_page_token(rows)
+
+
+def lazy_pagination(page_size, keyset=False, page_token=None,
+                    checkpoint=None, checkpoint_every=seed.CHECKPOINT_EVERY,
+                    row_format='dict'):
     """
     Generator that lazily loads pages of users.
     Only fetches the next page when needed.
+    With keyset=True (or a page_token) pages are sought by user_id instead
+    of OFFSET, so late pages are as cheap as the first one.
+    A checkpoint store resumes from its saved token, records the token of
+    the last handled page about every checkpoint_every rows and is cleared
+    when the walk completes.
+    row_format selects dict rows or a compact format from seed.ROW_FORMATS.
     """
+    if page_token is None and checkpoint is not None:
+        page_token = checkpoint.load()
+    if keyset or page_token is not None or checkpoint is not None:
+        unsaved = 0
+        while True:
+            page, next_token = paginate_users_after(page_size, page_token,
+                                                    row_format)
+            if not page:
+                break
+            yield page
+            page_token = next_token
+            unsaved += len(page)
+            if checkpoint is not None and unsaved >= checkpoint_every:
+                checkpoint.save(page_token)
+                unsaved = 0
+        if checkpoint is not None:
+            checkpoint.clear()
+        return
+
     offset = 0
     while True:
-        page = paginate_users(page_size, offset)
+        page = paginate_users(page_size, offset, row_format)
         if not page:
             break
         yield page
@@ -1,31 +1,104 @@
 
 #!/usr/bin/python3
 import seed
+from age_stats import AgeStats
 
+try:
+    import numpy as np
+except ImportError:  # chunked mode falls back to the generator
+    np = None
 
-def stream_user_ages():
-    """Generator that yields ages of users one by one."""
-    connection = seed.connect_to_prodev()
-    cursor = connection.cursor()
-    cursor.execute("SELECT age FROM user_data")
-    for (age,) in cursor:
-        yield age
-    cursor.close()
-    connection.close()
 
+def stream_user_ages(int_ages=True):
+    """
+    Generator that yields ages of users one by one.
+    Ages come back as int (cast in SQL on DECIMAL tables) unless int_ages
+    is False, which keeps the driver's Decimal values.
+    """
+    with seed.pooled_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT {seed.age_sql(int_ages)} FROM user_data")
+        for (age,) in cursor:
+            yield age
+        cursor.close()
 
-def compute_average_age():
-    """Compute average age using the stream_user_ages generator."""
+
+def average_age_pushdown():
+    """Lets the database compute COUNT and AVG of ages in a single row."""
+    with seed.pooled_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*), AVG(age) FROM user_data")
+        count, average = cursor.fetchone()
+        cursor.close()
+    return count, (float(average) if count else None)
+
+
+def average_age_chunked(chunk_size=seed.STREAM_CHUNK_SIZE):
+    """
+    Pulls integer ages chunk_size at a time into NumPy arrays and sums each
+    chunk vectorized, so Python loops once per chunk instead of per row.
+    """
+    total = 0
+    count = 0
+    with seed.pooled_connection() as connection:
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(f"SELECT {seed.age_sql(int_age=True)} FROM user_data")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            ages = np.array(rows, dtype=np.int64)
+            total += int(ages.sum())
+            count += ages.size
+        cursor.close()
+    return count, (total / count if count else None)
+
+
+def average_age_streamed():
+    """Averages ages one at a time through the stream_user_ages generator."""
     total = 0
     count = 0
     for age in stream_user_ages():
         total += age
         count += 1
+    return count, (total / count if count else None)
+
+
+def average_age_stats():
+    """
+    Reads the average from the saved AgeStats without scanning.
+    Databases created before user_data_stats existed fall back to the
+    pushdown aggregate until seed.create_table adds the table.
+    """
+    with seed.pooled_connection() as connection:
+        if not seed.has_table(connection, 'user_data_stats'):
+            stats = None
+        else:
+            stats = AgeStats.current(connection)
+    if stats is None:
+        return average_age_pushdown()
+    return stats.count, (stats.mean if stats.count else None)
+
+
+def compute_average_age(mode="stream"):
+    """
+    Compute average age using the stream_user_ages generator.
+    mode="pushdown" asks the database for the aggregate instead,
+    mode="chunked" reduces NumPy chunks (streaming when NumPy is missing)
+    and mode="stats" reads the incrementally maintained AgeStats.
+    """
+    if mode == "stats":
+        count, average = average_age_stats()
+    elif mode == "pushdown":
+        count, average = average_age_pushdown()
+    elif mode == "chunked" and np is not None:
+        count, average = average_age_chunked()
+    else:
+        count, average = average_age_streamed()
 
     if count == 0:
         print("No users found.")
     else:
-        average = total / count
         print(f"Average age of users: {average:.2f}")
 
 
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import seed
+
+
+def partition_bounds(partitions):
+    """
+    Splits user_data into at most `partitions` disjoint user_id ranges of
+    roughly equal size and returns them as (lower, upper) pairs, where a
+    range holds lower < user_id <= upper and None means unbounded.
+    """
+    with seed.pooled_connection() as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            SELECT {seed.user_id_sql("MAX(user_id)")} FROM (
+                SELECT user_id, NTILE(%s) OVER (ORDER BY user_id) AS part
+                FROM user_data
+            ) AS parts
+            GROUP BY part ORDER BY part
+        """, (partitions,))
+        uppers = [upper for (upper,) in cursor.fetchall()]
+        cursor.close()
+
+    if not uppers:
+        return []
+    # Leave the outer edges open so rows inserted during the scan still
+    # fall into some partition.
+    uppers[-1] = None
+    lowers = [None] + uppers[:-1]
+    return list(zip(lowers, uppers))
+
+
+def scan_partition(lower, upper, map_func, reduce_func, initial=None,
+                   where=None):
+    """
+    Streams the users with lower < user_id <= upper on a connection of its
+    own and folds map_func(user) into initial with reduce_func.
+    Runs inside a worker process, so it never touches the parent's pool.
+    Raises ConnectionError when the database can't be reached (the reason
+    is printed by seed.connect_to_prodev).
+    """
+    where = dict(where or {})
+    if lower is not None:
+        where['user_id__gt'] = lower
+    if upper is not None:
+        where['user_id__lte'] = upper
+    sql, params = seed.build_select(where=where)
+    connection = seed.connect_to_prodev()
+    if connection is None:
+        raise ConnectionError(
+            f"partition ({lower}, {upper}] could not connect to ALX_prodev")
+    try:
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        try:
+            cursor.execute(sql, params)
+            result = initial
+            for user in seed.iter_rows(cursor):
+                result = reduce_func(result, map_func(user))
+        finally:
+            cursor.close()
+    finally:
+        connection.close()
+    return result
+
+
+def parallel_scan(map_func, reduce_func, initial=None, partitions=None,
+                  combine_func=None, where=None):
+    """
+    Runs map_func/reduce_func over every user, one user_id range per worker
+    process, and merges the per-partition results with combine_func
+    (reduce_func by default). All three functions must be picklable, i.e.
+    defined at module level.
+    """
+    partitions = partitions or os.cpu_count() or 1
+    bounds = partition_bounds(partitions)
+    if not bounds:
+        return initial
+
+    with ProcessPoolExecutor(max_workers=len(bounds)) as executor:
+        futures = [
+            executor.submit(scan_partition, lower, upper, map_func,
+                            reduce_func, initial, where)
+            for lower, upper in bounds
+        ]
+        results = [future.result() for future in futures]
+    return functools.reduce(combine_func or reduce_func, results)
+
+
+def _age(user):
+    """Maps a user row to its age."""
+    return user["age"]
+
+
+def _add(total, value):
+    """Adds value to a running total."""
+    return total + value
+
+
+if __name__ == "__main__":
+    print(f"Sum of ages: {parallel_scan(_age, _add, initial=0)}")
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+import asyncio
+
+import seed
+
+try:
+    import aiosqlite
+except ImportError:  # only needed for the local SQLite stand-in
+    aiosqlite = None
+
+PREFETCH_DEPTH = 1
+
+
+async def _prefetched_pages(fetch_page, page_size, last_seen, prefetch):
+    """
+    Async generator over keyset pages where a background task keeps up to
+    `prefetch` pages (at least 1) fetched ahead of the consumer, so fetching
+    page N+1 overlaps with the consumer's work on page N.
+    When the consumer stops early, the producer is cancelled and awaited
+    together with the fetch it has in flight, so no worker thread or pooled
+    connection outlives the generator.
+    """
+    if prefetch < 1:
+        raise ValueError("prefetch must be at least 1")
+    # A slot is taken before each fetch and given back when the consumer
+    # takes the page, so fetched-but-unconsumed pages never exceed prefetch.
+    slots = asyncio.Semaphore(prefetch)
+    queue = asyncio.Queue()
+    inflight = None
+
+    async def producer():
+        nonlocal last_seen, inflight
+        try:
+            while True:
+                await slots.acquire()
+                inflight = asyncio.ensure_future(
+                    fetch_page(page_size, last_seen))
+                page = await asyncio.shield(inflight)
+                inflight = None
+                queue.put_nowait(page)
+                if not page:
+                    return
+                last_seen = page[-1]['user_id']
+        except Exception as e:
+            queue.put_nowait(e)
+
+    task = asyncio.create_task(producer())
+    try:
+        while True:
+            page = await queue.get()
+            slots.release()
+            if isinstance(page, Exception):
+                raise page
+            if not page:
+                break
+            yield page
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if inflight is not None:
+            await asyncio.gather(inflight, return_exceptions=True)
+
+
+def _mysql_fetcher(columns=None, where=None):
+    """Returns a coroutine function fetching keyset pages from MySQL."""
+    def fetch(page_size, last_seen):
+        with seed.pooled_connection() as connection:
+            cursor = connection.cursor(dictionary=True)
+            rows = seed.fetch_page_after(cursor, page_size, last_seen,
+                                         columns, where)
+            cursor.close()
+        return rows
+
+    async def fetch_page(page_size, last_seen):
+        # mysql.connector is blocking, so run each page in a worker thread.
+        return await asyncio.to_thread(fetch, page_size, last_seen)
+    return fetch_page
+
+
+def _sqlite_fetcher(db, columns=None, where=None):
+    """Returns a coroutine function fetching keyset pages from aiosqlite."""
+    async def fetch_page(page_size, last_seen):
+        sql, params = seed.build_select(columns, where, keyset=True,
+                                        after=last_seen, limit=page_size)
+        async with db.execute(sql.replace("%s", "?"), params) as cursor:
+            rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+    return fetch_page
+
+
+async def async_stream_users_in_batches(batch_size, prefetch=PREFETCH_DEPTH,
+                                        page_token=None, columns=None,
+                                        where=None, db_path=None):
+    """
+    Async generator that streams user_data in keyset batches of batch_size
+    while prefetching up to `prefetch` batches ahead.
+    Reads MySQL by default, or the SQLite file at db_path via aiosqlite.
+    """
+    last_seen = seed.decode_page_token(page_token) if page_token else None
+    if db_path is None:
+        fetch_page = _mysql_fetcher(columns, where)
+        async for page in _prefetched_pages(fetch_page, batch_size,
+                                            last_seen, prefetch):
+            yield page
+        return
+
+    async with aiosqlite.connect(db_path) as db:
+        db.row_factory = aiosqlite.Row
+        fetch_page = _sqlite_fetcher(db, columns, where)
+        async for page in _prefetched_pages(fetch_page, batch_size,
+                                            last_seen, prefetch):
+            yield page
+
+
+async def async_lazy_pagination(page_size, prefetch=PREFETCH_DEPTH,
+                                page_token=None, db_path=None):
+    """
+    Async generator that lazily loads pages of users, keeping the next
+    page in flight while the current one is being processed.
+    """
+    async for page in async_stream_users_in_batches(
+            page_size, prefetch, page_token, db_path=db_path):
+        yield page
+
+
+if __name__ == "__main__":
+    async def main():
+        """Counts users page by page with prefetching enabled."""
+        total = 0
+        async for page in async_lazy_pagination(100):
+            total += len(page)
+        print(f"Paged through {total} users")
+
+    asyncio.run(main())
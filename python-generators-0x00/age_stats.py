@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+"""
+Incrementally maintained age statistics for the user_data table.
+
+seed.insert_rows folds every inserted chunk into the saved AgeStats in the
+same transaction as the rows, so compute_average_age(mode="stats") in
+4-stream_ages.py reads current numbers without scanning user_data.
+"""
+import json
+import math
+from decimal import Decimal, ROUND_HALF_UP
+
+
+class AgeStats:
+    """
+    Running statistics for user ages: count, mean and variance (Welford /
+    Chan updates) plus a histogram of whole-year ages. Ages are stored as
+    whole numbers, so the histogram gives exact quantiles in O(distinct
+    ages) and no sketch such as a t-digest is needed.
+    The snapshot lives in the user_data_stats table next to user_data.
+    """
+    NAME = "age"
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, histogram=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.histogram = dict(histogram or {})
+
+    @staticmethod
+    def _whole(age):
+        """Rounds an age like a scale-0 DECIMAL column stores it."""
+        return int(Decimal(str(age)).to_integral_value(ROUND_HALF_UP))
+
+    def update(self, ages):
+        """Folds a batch of newly inserted ages into the statistics."""
+        ages = [self._whole(age) for age in ages]
+        if not ages:
+            return
+        count = len(ages)
+        mean = sum(ages) / count
+        m2 = sum((age - mean) ** 2 for age in ages)
+        for age in ages:
+            self.histogram[age] = self.histogram.get(age, 0) + 1
+
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    @property
+    def variance(self):
+        """Population variance of the ages, or None without data."""
+        return self.m2 / self.count if self.count else None
+
+    @property
+    def stddev(self):
+        """Population standard deviation of the ages, or None."""
+        return math.sqrt(self.variance) if self.count else None
+
+    def quantile(self, q):
+        """Returns the smallest age with at least q of the users at or
+        below it (q=0.5 is the median), or None without data."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for age in sorted(self.histogram):
+            seen += self.histogram[age]
+            if seen >= rank:
+                return age
+        return max(self.histogram)
+
+    def to_dict(self):
+        """Returns a JSON-serializable snapshot of the statistics."""
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'm2': self.m2,
+            'histogram': {str(age): n for age, n in self.histogram.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuilds statistics saved by to_dict."""
+        return cls(data['count'], data['mean'], data['m2'],
+                   {int(age): n for age, n in data['histogram'].items()})
+
+    @classmethod
+    def from_histogram(cls, histogram):
+        """Derives exact statistics from an age -> count histogram."""
+        count = sum(histogram.values())
+        if not count:
+            return cls()
+        mean = sum(age * n for age, n in histogram.items()) / count
+        m2 = sum(n * (age - mean) ** 2 for age, n in histogram.items())
+        return cls(count, mean, m2, histogram)
+
+    @classmethod
+    def load(cls, connection, lock=False):
+        """Reads the saved statistics in O(1), or None if never saved.
+        lock=True reads them FOR UPDATE, so concurrent writers fold their
+        rows in one after the other until the transaction ends."""
+        cursor = connection.cursor()
+        cursor.execute("SELECT payload FROM user_data_stats WHERE name = %s"
+                       + (" FOR UPDATE" if lock else ""), (cls.NAME,))
+        row = cursor.fetchone()
+        cursor.close()
+        return cls.from_dict(json.loads(row[0])) if row else None
+
+    @classmethod
+    def rebuild(cls, connection):
+        """Recomputes the statistics with one GROUP BY over user_data."""
+        cursor = connection.cursor()
+        cursor.execute("SELECT age, COUNT(*) FROM user_data GROUP BY age")
+        histogram = {}
+        for age, n in cursor.fetchall():
+            age = cls._whole(age)
+            histogram[age] = histogram.get(age, 0) + n
+        cursor.close()
+        return cls.from_histogram(histogram)
+
+    @classmethod
+    def current(cls, connection):
+        """Loads the saved statistics, rebuilding and saving them first
+        if there are none yet."""
+        stats = cls.load(connection)
+        if stats is None:
+            stats = cls.rebuild(connection)
+            stats.save(connection)
+        return stats
+
+    def save(self, connection, commit=True):
+        """Stores the statistics next to user_data."""
+        cursor = connection.cursor()
+        cursor.execute(
+            "REPLACE INTO user_data_stats (name, payload) VALUES (%s, %s)",
+            (self.NAME, json.dumps(self.to_dict())))
+        cursor.close()
+        if commit:
+            connection.commit()
@@ -0,0 +1,309 @@
+#!/usr/bin/python3
+"""
+Throughput and memory benchmark for the user_data generators.
+
+Seeds a local SQLite stand-in with synthetic users and drives the real
+generators (stream_users, stream_users_in_batches, lazy_pagination and
+stream_user_ages, through seed.build_select, row_cursor and iter_rows)
+against it: seed.pooled_connection is swapped for a DB-API shim that takes
+mysql.connector's cursor arguments and %s placeholders. Scenarios compare
+buffered against streaming cursors, row formats, and OFFSET against keyset
+paging. Every scenario runs in a fresh process so its peak RSS is its own.
+Results can be saved as JSON and compared with a previous run to catch
+regressions.
+
+    ./benchmark.py --rows 1000000 --output bench.json
+    ./benchmark.py --rows 1000000 --compare bench.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sqlite3
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+import seed
+
+SEED_CHUNK_SIZE = 10000
+DEFAULT_ROWS = 100000
+DEFAULT_PAGE_SIZE = 1000
+OFFSET_ROW_LIMIT = 1000000
+
+
+def seed_database(db_path, rows):
+    """Creates db_path with `rows` synthetic users unless it already has
+    exactly that many."""
+    connection = sqlite3.connect(db_path)
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS user_data (
+            user_id CHAR(36) PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            email VARCHAR(255) NOT NULL,
+            age DECIMAL NOT NULL
+        )
+    """)
+    (existing,) = connection.execute(
+        "SELECT COUNT(*) FROM user_data").fetchone()
+    if existing != rows:
+        connection.execute("DELETE FROM user_data")
+        generator = random.Random(rows)
+        for start in range(0, rows, SEED_CHUNK_SIZE):
+            stop = min(start + SEED_CHUNK_SIZE, rows)
+            connection.executemany(
+                "INSERT INTO user_data VALUES (?, ?, ?, ?)",
+                [(str(uuid.UUID(int=generator.getrandbits(128), version=4)),
+                  f"User {i}", f"user{i}@example.com",
+                  generator.randint(18, 100))
+                 for i in range(start, stop)])
+        connection.commit()
+    connection.close()
+
+
+def _dict_row(cursor, row):
+    """sqlite3 row factory matching mysql.connector's dictionary cursors."""
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class StandInCursor:
+    """sqlite3 cursor that accepts mysql.connector's cursor arguments and
+    %s placeholders. A buffered cursor reads the whole result on execute,
+    like mysql.connector's buffered cursors do."""
+
+    def __init__(self, connection, dictionary=False, buffered=None):
+        """Opens a cursor on a sqlite3 connection."""
+        self._cursor = connection.cursor()
+        if dictionary:
+            self._cursor.row_factory = _dict_row
+        self._buffered = buffered
+        self._rows = None
+
+    def execute(self, sql, params=()):
+        """Runs sql after switching its placeholders to sqlite3's."""
+        self._cursor.execute(sql.replace("%s", "?"), params)
+        self._rows = iter(self._cursor.fetchall()) if self._buffered else None
+
+    def fetchmany(self, size=1):
+        """Returns up to size more rows."""
+        if self._rows is not None:
+            return list(itertools.islice(self._rows, size))
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        """Returns every remaining row."""
+        if self._rows is not None:
+            return list(self._rows)
+        return self._cursor.fetchall()
+
+    def fetchone(self):
+        """Returns the next row, or None."""
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def __iter__(self):
+        """Iterates over the remaining rows."""
+        return iter(self.fetchone, None)
+
+    def close(self):
+        """Closes the cursor."""
+        self._cursor.close()
+
+
+class StandInConnection:
+    """The part of a mysql.connector connection the generators use, over
+    SQLite. buffered, when set, overrides every cursor's own choice."""
+
+    def __init__(self, db_path, buffered=None):
+        """Opens the SQLite stand-in at db_path."""
+        self._connection = sqlite3.connect(db_path)
+        self.buffered = buffered
+
+    def cursor(self, dictionary=False, buffered=None):
+        """Opens a StandInCursor."""
+        if self.buffered is not None:
+            buffered = self.buffered
+        return StandInCursor(self._connection, dictionary, buffered)
+
+    def close(self):
+        """Closes the SQLite connection."""
+        self._connection.close()
+
+
+def install_stand_in(db_path, buffered=None):
+    """Points seed.pooled_connection, and with it every generator module,
+    at the SQLite stand-in. Returns the shared connection."""
+    connection = StandInConnection(db_path, buffered)
+
+    @contextmanager
+    def pooled_connection(timeout=None):
+        yield connection
+
+    seed.pooled_connection = pooled_connection
+    seed._column_types = {
+        name.lower(): column_type.split("(")[0].lower()
+        for _, name, column_type, *_ in connection._connection.execute(
+            "PRAGMA table_info(user_data)")
+    }
+    return connection
+
+
+def stream_users(page_size):
+    """0-stream_users.stream_users with its default dict rows."""
+    return __import__('0-stream_users').stream_users(page_size)
+
+
+def stream_users_tuples(page_size):
+    """0-stream_users.stream_users with compact tuple rows."""
+    return __import__('0-stream_users').stream_users(page_size,
+                                                  row_format='tuple')
+
+
+def batches_offset(page_size):
+    """1-batch_processing.stream_users_in_batches with LIMIT ... OFFSET."""
+    batches = __import__('1-batch_processing').stream_users_in_batches(
+        page_size)
+    return itertools.chain.from_iterable(batches)
+
+
+def batches_keyset(page_size):
+    """1-batch_processing.stream_users_in_batches seeking on user_id."""
+    batches = __import__('1-batch_processing').stream_users_in_batches(
+        page_size, keyset=True)
+    return itertools.chain.from_iterable(batches)
+
+
+def pages_keyset(page_size):
+    """2-lazy_paginate.lazy_pagination seeking on user_id."""
+    pages = __import__('2-lazy_paginate').lazy_pagination(page_size,
+                                                       keyset=True)
+    return itertools.chain.from_iterable(pages)
+
+
+def stream_ages(page_size):
+    """4-stream_ages.stream_user_ages: a single-column streaming scan."""
+    return __import__('4-stream_ages').stream_user_ages()
+
+
+# name -> (generator, cursor buffering forced by the stand-in, if any)
+SCENARIOS = {
+    'stream_users_buffered': (stream_users, True),
+    'stream_users_streaming': (stream_users, None),
+    'stream_users_tuples': (stream_users_tuples, None),
+    'batches_offset': (batches_offset, None),
+    'batches_keyset': (batches_keyset, None),
+    'lazy_pagination_keyset': (pages_keyset, None),
+    'stream_user_ages': (stream_ages, None),
+}
+OFFSET_SCENARIOS = {'batches_offset'}
+
+
+def peak_rss_kb():
+    """Returns this process's peak resident set size in KiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_scenario(db_path, name, page_size):
+    """Drains one scenario and measures rows/sec, time-to-first-row and
+    peak RSS. Meant to run in its own process."""
+    generator, buffered = SCENARIOS[name]
+    connection = install_stand_in(db_path, buffered)
+    started = time.perf_counter()
+    first_row = None
+    rows = 0
+    for _ in generator(page_size):
+        if first_row is None:
+            first_row = time.perf_counter() - started
+        rows += 1
+    elapsed = time.perf_counter() - started
+    connection.close()
+    return {
+        'rows': rows,
+        'seconds': round(elapsed, 4),
+        'rows_per_sec': round(rows / elapsed) if elapsed else None,
+        'time_to_first_row_ms': (round(first_row * 1000, 3)
+                                 if first_row is not None else None),
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def run_benchmarks(db_path, rows, page_size, scenarios):
+    """Seeds the stand-in and runs every scenario in a fresh process."""
+    seed_database(db_path, rows)
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for name in scenarios:
+        if name in OFFSET_SCENARIOS and rows > OFFSET_ROW_LIMIT:
+            print(f"{name:<24} skipped (OFFSET paging is quadratic)")
+            continue
+        with context.Pool(1) as pool:
+            result = pool.apply(run_scenario, (db_path, name, page_size))
+        results[name] = result
+        print(f"{name:<24} {result['rows_per_sec'] or 0:>12,} rows/sec  "
+              f"first row {result['time_to_first_row_ms']} ms  "
+              f"peak RSS {result['peak_rss_kb']:,} KiB")
+    return {
+        'rows': rows,
+        'page_size': page_size,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Prints scenarios whose throughput fell, or whose peak RSS grew, by
+    more than tolerance against baseline. Returns True if any did."""
+    regressed = False
+    for name, result in report['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        if (before['rows_per_sec'] and result['rows_per_sec'] is not None
+                and result['rows_per_sec']
+                < before['rows_per_sec'] * (1 - tolerance)):
+            print(f"REGRESSION {name}: {before['rows_per_sec']:,} -> "
+                  f"{result['rows_per_sec']:,} rows/sec")
+            regressed = True
+        if result['peak_rss_kb'] > before['peak_rss_kb'] * (1 + tolerance):
+            print(f"REGRESSION {name}: peak RSS {before['peak_rss_kb']:,} "
+                  f"-> {result['peak_rss_kb']:,} KiB")
+            regressed = True
+    return regressed
+
+
+def main():
+    """Parses the command line and runs the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS)
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument('--db', default='benchmark.db',
+                        help="SQLite stand-in, reused between runs")
+    parser.add_argument('--scenario', action='append',
+                        choices=sorted(SCENARIOS),
+                        help="run only this scenario (repeatable)")
+    parser.add_argument('--output', help="write the results as JSON")
+    parser.add_argument('--compare', help="baseline JSON to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.db, args.rows, args.page_size,
+                            args.scenario or list(SCENARIOS))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline:
+            if compare(report, json.load(baseline), args.tolerance):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+"""
+External-memory sort and group-by for streamed users.
+
+external_sort keeps at most run_size items in memory: each full buffer is
+sorted and spilled to a temporary file as a sorted run, and the runs are
+merged back lazily with a k-way heap merge. group_by builds on it to group
+the output of stream_users() by age, email domain or any other key with
+bounded memory.
+"""
+import heapq
+import itertools
+import pickle
+import tempfile
+
+RUN_SIZE = 100000
+MAX_FAN_IN = 64
+SPILL_BLOCK = 1024
+
+
+def _spill(items):
+    """Writes already sorted items to an anonymous temporary file."""
+    run = tempfile.TemporaryFile()
+    items = iter(items)
+    while True:
+        block = list(itertools.islice(items, SPILL_BLOCK))
+        if not block:
+            break
+        pickle.dump(block, run, pickle.HIGHEST_PROTOCOL)
+    run.seek(0)
+    return run
+
+
+def _read_run(run):
+    """Yields the items of a spilled run back in order."""
+    while True:
+        try:
+            block = pickle.load(run)
+        except EOFError:
+            return
+        yield from block
+
+
+def _merge_runs(runs, key, reverse):
+    """Merges sorted runs, given in input order, into one new run and
+    closes them."""
+    merged = _spill(heapq.merge(*map(_read_run, runs), key=key,
+                                reverse=reverse))
+    for run in runs:
+        run.close()
+    return merged
+
+
+def external_sort(items, key=None, reverse=False, run_size=RUN_SIZE):
+    """
+    Generator that yields items sorted by key without holding more than
+    run_size of them (plus one block per run being merged) in memory.
+    Equal keys keep their input order, as with sorted().
+    Runs are merged by level: once MAX_FAN_IN runs of one level pile up
+    they become a single run of the next level, so every item is rewritten
+    only once per level (log-many times) rather than on every merge.
+    """
+    items = iter(items)
+    levels = [[]]
+    try:
+        while True:
+            buffer = list(itertools.islice(items, run_size))
+            if not buffer:
+                break
+            buffer.sort(key=key, reverse=reverse)
+            if levels == [[]] and len(buffer) < run_size:
+                # Everything fit in memory: no need to touch the disk.
+                yield from buffer
+                return
+            levels[0].append(_spill(buffer))
+            for level, runs in enumerate(levels):
+                if len(runs) < MAX_FAN_IN:
+                    break
+                if level + 1 == len(levels):
+                    levels.append([])
+                # Higher levels hold earlier input, so the merged run
+                # goes last in the next level and ties stay stable.
+                levels[level + 1].append(_merge_runs(runs, key, reverse))
+                levels[level] = []
+
+        # Oldest input first; merge the newest (smallest) runs until the
+        # final merge fits in MAX_FAN_IN open files.
+        runs = [run for level in reversed(levels) for run in level]
+        levels = [runs]
+        while len(runs) > MAX_FAN_IN:
+            runs[-MAX_FAN_IN:] = [_merge_runs(runs[-MAX_FAN_IN:], key,
+                                              reverse)]
+        yield from heapq.merge(*map(_read_run, runs), key=key,
+                               reverse=reverse)
+    finally:
+        for runs in levels:
+            for run in runs:
+                run.close()
+
+
+def group_by(items, key, run_size=RUN_SIZE):
+    """
+    Generator of (key, group) pairs in key order, where group iterates the
+    items sharing that key. Like itertools.groupby, a group must be used
+    before moving on to the next one.
+    """
+    return itertools.groupby(external_sort(items, key, run_size=run_size),
+                             key)
+
+
+def by_age(user):
+    """Sort key: the user's age."""
+    return user["age"]
+
+
+def by_email_domain(user):
+    """Sort key: the domain part of the user's email, lowercased."""
+    return user["email"].rpartition("@")[2].lower()
+
+
+if __name__ == "__main__":
+    stream_users = __import__('0-stream_users').stream_users
+    for domain, users in group_by(stream_users(), by_email_domain):
+        print(f"{domain}: {sum(1 for _ in users)} users")
@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+"""
+A small pipeline layer over the user_data generators.
+
+A Pipeline pulls from one source (e.g. stream_users()), runs it through
+filter and map stages and hands the result to one or more consumers. Each
+stage runs in its own thread and talks to the next one through a bounded
+queue, so a slow stage holds the upstream ones back instead of letting
+rows pile up in memory. Map stages can fan out over a thread or process
+pool, and run() feeds several consumers from a single scan.
+"""
+import itertools
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+QUEUE_SIZE = 1024
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class _Failure:
+    """Carries an exception raised by a stage to the consuming side."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(channel, item, stop):
+    """Blocks until item fits in channel, unless the pipeline stopped.
+    Returns False once the pipeline is stopping."""
+    while not stop.is_set():
+        try:
+            channel.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(channel, stop):
+    """Yields the items of a channel up to its end marker, re-raising the
+    error of a failed stage. Returns early once the pipeline stops."""
+    while True:
+        try:
+            item = channel.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            if stop.is_set():
+                return
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _Failure):
+            raise item.error
+        yield item
+
+
+def _ordered_map(func, items, workers, kind):
+    """Maps func over items on a pool while keeping the input order and at
+    most two calls per worker in flight."""
+    executor_class = ProcessPoolExecutor if kind == 'process' \
+        else ThreadPoolExecutor
+    with executor_class(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class Pipeline:
+    """Source -> filter/map stages -> consumers, linked by bounded queues."""
+
+    def __init__(self, source, maxsize=QUEUE_SIZE, stages=()):
+        """Wraps an iterable source; maxsize bounds every queue."""
+        self.source = source
+        self.maxsize = maxsize
+        self.stages = list(stages)
+
+    def _extend(self, stage):
+        """Returns a new pipeline with stage appended."""
+        return Pipeline(self.source, self.maxsize, self.stages + [stage])
+
+    def filter(self, predicate):
+        """Keeps only the items for which predicate returns true."""
+        return self._extend(lambda items: filter(predicate, items))
+
+    def map(self, func, workers=1, kind='thread'):
+        """
+        Applies func to every item. With workers > 1 the calls run on a
+        thread pool, or a process pool for kind='process' (func must then
+        be picklable), and results keep their input order.
+        """
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unknown map stage kind: {kind}")
+        if workers <= 1:
+            return self._extend(lambda items: map(func, items))
+        return self._extend(
+            lambda items: _ordered_map(func, items, workers, kind))
+
+    def _start(self, stop):
+        """Starts one thread per stage and returns the final queue."""
+        threads = []
+
+        def pump(items, channel):
+            try:
+                for item in items:
+                    if not _put(channel, item, stop):
+                        return
+                _put(channel, _DONE, stop)
+            except BaseException as error:
+                _put(channel, _Failure(error), stop)
+            finally:
+                # Closing a stage that stopped early shuts down its pool,
+                # and closing the source releases e.g. its connection.
+                close = getattr(items, 'close', None)
+                if close is not None:
+                    close()
+
+        channel = queue.Queue(self.maxsize)
+        threads.append(threading.Thread(
+            target=pump, args=(iter(self.source), channel), daemon=True))
+        for stage in self.stages:
+            output = queue.Queue(self.maxsize)
+            threads.append(threading.Thread(
+                target=pump, args=(stage(_drain(channel, stop)), output),
+                daemon=True))
+            channel = output
+        for thread in threads:
+            thread.start()
+        return channel
+
+    def __iter__(self):
+        """Runs the pipeline and yields its output items."""
+        stop = threading.Event()
+        try:
+            yield from _drain(self._start(stop), stop)
+        finally:
+            stop.set()
+
+    def run(self, *consumers):
+        """
+        Runs the pipeline once and feeds every output item to all the
+        consumers. A consumer is a callable taking an iterable; each runs
+        in its own thread behind its own bounded queue, and their return
+        values come back as a list in the same order.
+        """
+        stop = threading.Event()
+        channels = [queue.Queue(self.maxsize) for _ in consumers]
+        finished = [threading.Event() for _ in consumers]
+        results = [None] * len(consumers)
+        errors = [None] * len(consumers)
+
+        def consume(index):
+            try:
+                results[index] = consumers[index](
+                    _drain(channels[index], stop))
+            except BaseException as error:
+                errors[index] = error
+            finally:
+                # From now on the broadcast skips this consumer, so one
+                # that returns early never blocks the others.
+                finished[index].set()
+
+        threads = [threading.Thread(target=consume, args=(index,),
+                                    daemon=True)
+                   for index in range(len(consumers))]
+        for thread in threads:
+            thread.start()
+
+        try:
+            try:
+                for item in _drain(self._start(stop), stop):
+                    for index, channel in enumerate(channels):
+                        if not finished[index].is_set():
+                            _put(channel, item, finished[index])
+                    if all(event.is_set() for event in finished):
+                        break
+                end = _DONE
+            except BaseException as error:
+                end = _Failure(error)
+            for index, channel in enumerate(channels):
+                _put(channel, end, finished[index])
+            for thread in threads:
+                thread.join()
+        finally:
+            stop.set()
+
+        for error in errors:
+            if error is not None:
+                raise error
+        return results
+
+
+def average_age(users):
+    """Consumer that returns the average age of the users it receives."""
+    total = 0
+    count = 0
+    for user in users:
+        total += user["age"]
+        count += 1
+    return total / count if count else None
+
+
+def batch_consumer(sink, batch_size=1000, predicate=None):
+    """Returns a consumer that writes the users matching predicate to a
+    sink from sinks.py in batches, and returns how many it wrote."""
+    def consume(users):
+        if predicate is not None:
+            users = filter(predicate, users)
+        written = 0
+        while True:
+            batch = list(itertools.islice(users, batch_size))
+            if not batch:
+                break
+            sink.write_batch(batch)
+            written += len(batch)
+        sink.flush()
+        return written
+    return consume
+
+
+if __name__ == "__main__":
+    import sinks
+
+    stream_users = __import__('0-stream_users').stream_users
+    # One scan serves both jobs: batch_processing's over-25 output and
+    # compute_average_age's average over every user.
+    with sinks.JsonLinesSink() as sink:
+        written, average = Pipeline(stream_users(row_format='dict')).run(
+            batch_consumer(sink, predicate=lambda user: user["age"] > 25),
+            average_age,
+        )
+    print(f"Users older than 25: {written}")
+    print(f"Average age of users: {average:.2f}")
@@ -1,19 +1,94 @@
 
 #!/usr/bin/python3
-import mysql.connector
-from mysql.connector import Error
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import base64
 import csv
+import hashlib
+import io
+import itertools
+import math
+import os
+import sqlite3
+import threading
+import time
 import uuid
 
+import snapshot
+from age_stats import AgeStats
+
+try:
+    import mysql.connector
+    from mysql.connector import Error, errorcode, pooling
+except ImportError:  # the SQLite stand-ins only need the query helpers
+    mysql = errorcode = pooling = None
+
+    class Error(Exception):
+        """Stands in for mysql.connector.Error when the driver is missing"""
+
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',
+    'password': 'your_mysql_password',  # <-- Replace with your actual password
+}
+INSERT_CHUNK_SIZE = 1000
+CSV_SPLIT_SIZE = 8 * 1024 * 1024
+BLOOM_ERROR_RATE = 0.01
+BLOOM_MIN_CAPACITY = 100000
+STREAM_CHUNK_SIZE = 1000
+POOL_SIZE = 5
+POOL_TIMEOUT = 30
+POOL_RETRY_INTERVAL = 0.05
+INTEGER_AGE_TYPE = "SMALLINT UNSIGNED"
+CHECKPOINT_EVERY = 10000
+USER_COLUMNS = ('user_id', 'name', 'email', 'age')
+FILTER_OPERATORS = {
+    'eq': '=',
+    'ne': '<>',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+    'like': 'LIKE',
+    'in': 'IN',
+}
+ROW_FORMATS = ('dict', 'tuple', 'namedtuple', 'record')
+
+UserRow = namedtuple('UserRow', USER_COLUMNS)
+
+
+class UserRecord:
+    """Slotted user_data row: attribute access without a per-row dict"""
+    __slots__ = USER_COLUMNS
+
+    def __init__(self, user_id, name, email, age):
+        self.user_id = user_id
+        self.name = name
+        self.email = email
+        self.age = age
+
+    def __repr__(self):
+        return (f"UserRecord(user_id={self.user_id!r}, name={self.name!r}, "
+                f"email={self.email!r}, age={self.age!r})")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_column_types = None
+
+
+def require_driver():
+    """Raises ImportError unless mysql-connector-python is installed"""
+    if mysql is None:
+        raise ImportError("mysql-connector-python is required to reach MySQL")
+
 
 def connect_db():
     """Connects to the MySQL server (no database specified yet)"""
+    require_driver()
     try:
-        connection = mysql.connector.connect(
-            host='localhost',
-            user='root',
-            password='your_mysql_password'  # <-- Replace with your actual password
-        )
+        connection = mysql.connector.connect(**DB_CONFIG)
         return connection
     except Error as e:
         print(f"Error: {e}")
@@ -32,57 +107,270 @@ def create_database(connection):
 
 def connect_to_prodev():
     """Connects directly to ALX_prodev database"""
+    require_driver()
     try:
         connection = mysql.connector.connect(
-            host='localhost',
-            user='root',
-            password='your_mysql_password',  # <-- Replace with your actual password
-            database='ALX_prodev'
-        )
+            database='ALX_prodev', **DB_CONFIG)
+        load_schema(connection)
         return connection
     except Error as e:
         print(f"Connection to ALX_prodev failed: {e}")
         return None
 
 
-def create_table(connection):
-    """Creates the user_data table"""
+def get_pool(pool_size=POOL_SIZE):
+    """
+    Returns the shared ALX_prodev connection pool, creating it on first use.
+    pool_size only matters for that first call; the pool never grows.
+    """
+    global _pool
+    # Checked again under the lock: stage threads and asyncio.to_thread
+    # workers may race here, and two pools would break the size bound.
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                require_driver()
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name='alx_prodev',
+                    pool_size=pool_size,
+                    pool_reset_session=True,
+                    database='ALX_prodev',
+                    **DB_CONFIG
+                )
+    return _pool
+
+
+@contextmanager
+def pooled_connection(timeout=POOL_TIMEOUT):
+    """
+    Checks a connection out of the shared pool and returns it on exit.
+    The pool itself fails at once when it is empty, so the checkout is
+    retried for up to timeout seconds before the PoolError is raised.
+    The connection is pinged (and reconnected if it went stale) before it
+    is handed out.
+    A generator that streams inside this block (stream_users,
+    stream_users_in_batches, stream_user_ages, ...) holds its pool slot
+    until it is exhausted or closed, so more than POOL_SIZE open streams
+    wait for one another.
+    """
+    connection = checkout(timeout)
+    try:
+        connection.ping(reconnect=True, attempts=3, delay=1)
+        load_schema(connection)
+        yield connection
+    finally:
+        if connection.unread_result:
+            # Abandoned stream: drop the socket rather than drain the rest
+            # of the result set. The ping on its next checkout reconnects it.
+            connection.shutdown()
+        try:
+            connection.close()
+        except Error:
+            pass
+
+
+def checkout(timeout=POOL_TIMEOUT):
+    """
+    Gets a connection from the shared pool, polling every
+    POOL_RETRY_INTERVAL seconds while it is exhausted, and re-raises the
+    pool's PoolError once timeout seconds have passed.
+    """
+    pool = get_pool()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return pool.get_connection()
+        except pooling.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(POOL_RETRY_INTERVAL)
+
+
+def load_schema(connection):
+    """
+    Looks up the column types of user_data once per process, on the first
+    connection that finds the table, so queries can adapt to the BINARY id
+    and integer age layouts.
+    """
+    global _column_types
+    if _column_types is not None:
+        return
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT COLUMN_NAME, DATA_TYPE FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'user_data'
+    """)
+    rows = cursor.fetchall()
+    cursor.close()
+    if rows:
+        _column_types = {
+            _text(column).lower(): _text(data_type).lower()
+            for column, data_type in rows
+        }
+
+
+def _text(value):
+    """Decodes information_schema values some server versions return as
+    bytes"""
+    return value.decode() if isinstance(value, (bytes, bytearray)) else value
+
+
+def uses_binary_ids():
+    """Tells whether user_data.user_id is stored as BINARY(16)"""
+    return (_column_types or {}).get('user_id') == 'binary'
+
+
+def uses_decimal_age():
+    """Tells whether user_data.age is still the original DECIMAL column"""
+    return (_column_types or {}).get('age', 'decimal') == 'decimal'
+
+
+def uuid7():
+    """
+    Returns a time-ordered UUID in the version 7 layout: a 48-bit Unix
+    millisecond timestamp followed by random bits, so new keys land at the
+    end of the primary key index instead of at random pages.
+    """
+    value = (time.time_ns() // 1000000) << 80
+    value |= int.from_bytes(os.urandom(10), 'big')
+    value = (value & ~(0xF << 76)) | (0x7 << 76)
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)
+    return uuid.UUID(int=value)
+
+
+def uuid_to_bin(user_id):
+    """Converts a textual user_id to its 16-byte BINARY form"""
+    return uuid.UUID(user_id).bytes
+
+
+def bin_to_uuid(raw):
+    """Converts a 16-byte BINARY user_id back to its textual form"""
+    return str(uuid.UUID(bytes=bytes(raw)))
+
+
+def new_user_id():
+    """Returns a fresh time-ordered user_id in the table's storage format"""
+    user_id = uuid7()
+    return user_id.bytes if uses_binary_ids() else str(user_id)
+
+
+def user_id_sql(expression='user_id'):
+    """Returns SQL that reads a user_id expression in its textual form"""
+    if uses_binary_ids():
+        return f"BIN_TO_UUID({expression})"
+    return expression
+
+
+def age_sql(int_age=False):
+    """
+    Returns SQL that reads age, cast to an integer on DECIMAL tables when
+    int_age is set so the driver returns int rather than Decimal.
+    """
+    if int_age and uses_decimal_age():
+        return "CAST(age AS SIGNED)"
+    return "age"
+
+
+def user_id_param():
+    """Returns the placeholder that compares a textual id with user_id"""
+    return "UUID_TO_BIN(%s)" if uses_binary_ids() else "%s"
+
+
+def create_table(connection, index_age=False, binary_ids=False,
+                 integer_age=False):
+    """
+    Creates the user_data table.
+    With index_age=True a secondary index on age is added as well, so age
+    filters pushed down by the generators can avoid a full scan.
+    With binary_ids=True user_id is a 16-byte BINARY key instead of
+    CHAR(36); the generators still read and accept the textual form.
+    With integer_age=True age is a native integer instead of DECIMAL.
+    """
+    global _column_types
+    id_type = "BINARY(16)" if binary_ids else "CHAR(36)"
+    age_type = INTEGER_AGE_TYPE if integer_age else "DECIMAL"
     try:
         cursor = connection.cursor()
-        cursor.execute("""
+        cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS user_data (
-                user_id CHAR(36) PRIMARY KEY,
+                user_id {id_type} PRIMARY KEY,
                 name VARCHAR(255) NOT NULL,
                 email VARCHAR(255) NOT NULL,
-                age DECIMAL NOT NULL
+                age {age_type} NOT NULL
+            );
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_data_stats (
+                name VARCHAR(64) PRIMARY KEY,
+                payload TEXT NOT NULL
             );
         """)
         print("Table user_data created successfully")
     except Error as e:
         print(f"Error creating table: {e}")
+        return
+    _column_types = None
+    load_schema(connection)
+    create_index(connection, "idx_user_data_email", "email", unique=True)
+    # Seeds the stats row from any rows the table already holds.
+    AgeStats.current(connection)
+    if index_age:
+        create_index(connection, "idx_user_data_age", "age")
 
 
-def insert_data(connection, csv_filename):
-    """Inserts user data from a CSV file into the table"""
+def convert_age_to_int(connection):
+    """
+    Migrates an existing user_data.age column from DECIMAL to a native
+    integer, so reads return int instead of decimal.Decimal.
+    """
+    global _column_types
     try:
         cursor = connection.cursor()
-        with open(csv_filename, newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                user_id = str(uuid.uuid4())
-                name = row['name']
-                email = row['email']
-                age = row['age']
-
-                cursor.execute("""
-                    SELECT * FROM user_data WHERE email = %s
-                """, (email,))
-                if not cursor.fetchone():
-                    cursor.execute("""
-                        INSERT INTO user_data (user_id, name, email, age)
-                        VALUES (%s, %s, %s, %s)
-                    """, (user_id, name, email, age))
-        connection.commit()
+        cursor.execute(
+            f"ALTER TABLE user_data MODIFY age {INTEGER_AGE_TYPE} NOT NULL")
+        cursor.close()
+        print("Column user_data.age converted to integer")
+    except Error as e:
+        print(f"Error converting age column: {e}")
+        return
+    _column_types = None
+    load_schema(connection)
+
+
+def create_index(connection, index_name, columns, unique=False):
+    """Creates an index on user_data unless it already exists"""
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"CREATE {kind} {index_name} ON user_data ({columns})")
+        print(f"Index {index_name} created successfully")
+    except Error as e:
+        if e.errno != errorcode.ER_DUP_KEYNAME:
+            print(f"Error creating index {index_name}: {e}")
+
+
+def insert_data(connection, csv_filename, chunk_size=INSERT_CHUNK_SIZE,
+                workers=None, dedupe=None):
+    """
+    Inserts user data from a CSV file into the table.
+    Rows are sent chunk_size at a time as one multi-row INSERT IGNORE and
+    committed per chunk; duplicate emails are dropped by the UNIQUE index
+    on email instead of being looked up row by row.
+    With workers > 1 the file is parsed in that many processes, byte range
+    by byte range, while this process keeps writing.
+    dedupe='set' or 'bloom' loads the existing emails once and drops known
+    or repeated emails before they are sent (see skip_known_emails).
+    """
+    try:
+        if workers and workers > 1:
+            records = read_csv_parallel(csv_filename, workers)
+        else:
+            records = read_csv(csv_filename)
+        if dedupe:
+            emails = load_existing_emails(connection, bloom=dedupe == 'bloom')
+            records = skip_known_emails(connection, records, emails)
+        rows = ((new_user_id(), *record) for record in records)
+        insert_rows(connection, rows, chunk_size)
         print("CSV data inserted successfully.")
     except Error as e:
         print(f"Data insertion error: {e}")
@@ -90,15 +378,487 @@ def insert_data(connection, csv_filename):
         print(f"CSV file {csv_filename} not found.")
 
 
-def stream_users(connection):
-    """Generator that yields user records one at a time"""
+def read_csv(csv_filename):
+    """Generator that yields (name, email, age) tuples from a CSV file"""
+    with open(csv_filename, newline='') as csvfile:
+        for row in csv.DictReader(csvfile):
+            yield row['name'], row['email'], row['age']
+
+
+class BloomFilter:
+    """
+    Compact probabilistic set: no false negatives, and false positives at
+    about error_rate once capacity items have been added.
+    """
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate)
+                               / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        """Derives the bit positions of item by double hashing"""
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        """Adds item to the filter"""
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        """Tells whether item was probably added"""
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+def load_existing_emails(connection, bloom=False):
+    """
+    Loads every email in user_data once, lowercased like the table's
+    case-insensitive collation compares them: into a set, or with
+    bloom=True into a BloomFilter sized for twice the current table.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM user_data")
+    (count,) = cursor.fetchone()
+    emails = BloomFilter(2 * count + BLOOM_MIN_CAPACITY) if bloom else set()
+    cursor.close()
+
+    cursor = connection.cursor(buffered=False)
+    cursor.execute("SELECT email FROM user_data")
+    for (email,) in iter_rows(cursor, row_format='tuple'):
+        emails.add(email.lower())
+    cursor.close()
+    return emails
+
+
+def skip_known_emails(connection, records, emails,
+                      chunk_size=INSERT_CHUNK_SIZE):
+    """
+    Generator that drops (name, email, age) records whose email is already
+    in emails (from load_existing_emails) or appeared earlier in records.
+    With a BloomFilter, the emails passed so far are also kept in an exact
+    set, so repeats within records are dropped without asking the database
+    (their first copy isn't in user_data yet); other probable hits are
+    confirmed against user_data with one IN query per chunk, and whatever
+    still slips through is caught by the UNIQUE index on email.
+    """
+    exact = isinstance(emails, set)
+    seen = emails if exact else set()
+    skipped = 0
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            break
+        hits = []
+        repeats = []
+        for record in chunk:
+            email = record[1].lower()
+            repeats.append(email in seen)
+            hits.append(repeats[-1] or email in emails)
+            emails.add(email)
+            seen.add(email)
+        probable = {
+            record[1].lower()
+            for record, hit, repeat in zip(chunk, hits, repeats)
+            if hit and not repeat
+        }
+        if not exact and probable:
+            existing = confirm_existing_emails(connection, probable)
+            hits = [repeat or (hit and record[1].lower() in existing)
+                    for record, hit, repeat in zip(chunk, hits, repeats)]
+        for record, hit in zip(chunk, hits):
+            if hit:
+                skipped += 1
+            else:
+                yield record
+    print(f"{skipped} rows skipped as duplicates before insert")
+
+
+def confirm_existing_emails(connection, emails):
+    """Returns the lowercased emails from emails that user_data holds"""
+    emails = list(emails)
+    placeholders = ", ".join(["%s"] * len(emails))
+    cursor = connection.cursor()
+    cursor.execute(
+        f"SELECT email FROM user_data WHERE email IN ({placeholders})",
+        emails)
+    found = {email.lower() for (email,) in cursor.fetchall()}
+    cursor.close()
+    return found
+
+
+def csv_byte_ranges(csv_filename, split_size=CSV_SPLIT_SIZE):
+    """
+    Splits a CSV file into (start, end) byte ranges of about split_size
+    that start and end on line boundaries. The header line is skipped.
+    Quoted fields must not span several lines.
+    """
+    with open(csv_filename, 'rb') as csvfile:
+        csvfile.readline()
+        start = csvfile.tell()
+        size = os.fstat(csvfile.fileno()).st_size
+        while start < size:
+            csvfile.seek(min(start + split_size, size))
+            csvfile.readline()
+            end = csvfile.tell()
+            yield start, end
+            start = end
+
+
+def parse_csv_range(csv_filename, start, end):
+    """
+    Parses one byte range of a CSV file into (name, email, age) tuples.
+    Runs in a worker process, so it rereads the header to find the columns.
+    """
+    with open(csv_filename, 'rb') as csvfile:
+        header = next(csv.reader([csvfile.readline().decode()]))
+        csvfile.seek(start)
+        data = csvfile.read(end - start).decode()
+    name, email, age = (header.index(column)
+                        for column in ('name', 'email', 'age'))
+    return [(row[name], row[email], row[age])
+            for row in csv.reader(io.StringIO(data, newline='')) if row]
+
+
+def read_csv_parallel(csv_filename, workers, split_size=CSV_SPLIT_SIZE):
+    """
+    Generator that yields (name, email, age) tuples parsed by a pool of
+    worker processes, in file order. At most two ranges per worker are in
+    flight, so a slow writer stalls the parsers instead of piling up rows.
+    """
+    ranges = csv_byte_ranges(csv_filename, split_size)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(executor.submit(parse_csv_range, csv_filename,
+                                           start, end))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def insert_rows(connection, rows, chunk_size=INSERT_CHUNK_SIZE):
+    """
+    Bulk inserts (user_id, name, email, age) tuples into user_data.
+    Commits after every chunk, reports throughput as it goes and returns
+    the number of rows actually inserted.
+    When the user_data_stats table exists, every chunk also locks the saved
+    AgeStats row, folds in the inserted ages and saves it in the same
+    transaction, so concurrent seeders never lose each other's updates.
+    """
+    track_stats = has_table(connection, 'user_data_stats')
+    cursor = connection.cursor()
+    started = last_report = time.perf_counter()
+    read = inserted = 0
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        if track_stats:
+            stats = AgeStats.load(connection, lock=True)
+        placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(chunk))
+        cursor.execute(
+            "INSERT IGNORE INTO user_data (user_id, name, email, age) "
+            f"VALUES {placeholders}",
+            [value for row in chunk for value in row])
+        inserted += cursor.rowcount
+        if track_stats:
+            if stats is None:
+                # No saved row yet: the rebuild already counts this chunk.
+                stats = AgeStats.rebuild(connection)
+            else:
+                stats.update(inserted_ages(cursor, chunk))
+            stats.save(connection, commit=False)
+        connection.commit()
+        read += len(chunk)
+
+        now = time.perf_counter()
+        if now - last_report >= 1:
+            print(f"{read} rows read, {inserted} inserted "
+                  f"({read / (now - started):.0f} rows/sec)")
+            last_report = now
+    cursor.close()
+
+    elapsed = time.perf_counter() - started
+    rate = read / elapsed if elapsed else float(read)
+    print(f"{read} rows read, {inserted} inserted ({rate:.0f} rows/sec)")
+    return inserted
+
+
+def has_table(connection, table):
+    """Tells whether the current database has a table with that name"""
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    (count,) = cursor.fetchone()
+    cursor.close()
+    return count > 0
+
+
+def inserted_ages(cursor, chunk):
+    """
+    Returns the ages of the chunk rows the last INSERT IGNORE kept.
+    Only a chunk that lost rows to duplicates costs an extra lookup, by the
+    freshly generated user_ids.
+    """
+    if cursor.rowcount == len(chunk):
+        return [row[3] for row in chunk]
+    if cursor.rowcount <= 0:
+        return []
+    placeholders = ", ".join(["%s"] * len(chunk))
+    cursor.execute(
+        f"SELECT age FROM user_data WHERE user_id IN ({placeholders})",
+        [row[0] for row in chunk])
+    return [age for (age,) in cursor.fetchall()]
+
+
+def stream_users(connection, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Generator that yields user records one at a time.
+    Uses an unbuffered cursor so rows stay on the server until they are
+    fetched, chunk_size at a time.
+    """
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM user_data")
-        while True:
-            row = cursor.fetchone()
-            if row is None:
-                break
-            yield row
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        cursor.execute(*build_select())
+        yield from iter_rows(cursor, chunk_size)
     except Error as e:
         print(f"Error streaming data: {e}")
+
+
+def iter_rows(cursor, chunk_size=STREAM_CHUNK_SIZE, row_format='dict'):
+    """Yields the rows of an executed cursor, fetching chunk_size at a time"""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from convert_rows(rows, row_format)
+
+
+def row_cursor(connection, row_format='dict', buffered=None):
+    """
+    Opens a cursor for rows in row_format: 'dict' (the default, one dict
+    per row), or 'tuple', 'namedtuple' (UserRow) and 'record' (UserRecord),
+    which skip the per-row dict and its key hashing.
+    """
+    if row_format not in ROW_FORMATS:
+        raise ValueError(f"Unknown row format: {row_format}")
+    return connection.cursor(dictionary=row_format == 'dict',
+                             buffered=buffered)
+
+
+def convert_rows(rows, row_format):
+    """
+    Converts a fetched list of rows from a row_cursor into row_format.
+    'namedtuple' and 'record' need all four user_data columns.
+    """
+    if row_format == 'namedtuple':
+        return list(map(UserRow._make, rows))
+    if row_format == 'record':
+        return list(itertools.starmap(UserRecord, rows))
+    return rows
+
+
+def row_user_id(row):
+    """Returns the user_id of a row in any of the ROW_FORMATS"""
+    if isinstance(row, dict):
+        return row['user_id']
+    if isinstance(row, UserRecord):
+        return row.user_id
+    return row[0]
+
+
+def export_snapshot(connection, directory, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Exports user_data, in user_id order, to a columnar memory-mapped
+    snapshot that snapshot.UserSnapshot can read without MySQL.
+    Returns the number of rows exported.
+    """
+    cursor = connection.cursor(buffered=False)
+    cursor.execute(*build_select(USER_COLUMNS, keyset=True))
+    with snapshot.SnapshotWriter(directory) as writer:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            writer.write_rows(rows)
+    cursor.close()
+    print(f"Exported {writer.rows} users to snapshot {directory}")
+    return writer.rows
+
+
+def encode_page_token(user_id):
+    """Encodes the last seen user_id as an opaque page token"""
+    return base64.urlsafe_b64encode(str(user_id).encode()).decode()
+
+
+def decode_page_token(page_token):
+    """Decodes a page token back into the last seen user_id"""
+    return base64.urlsafe_b64decode(page_token.encode()).decode()
+
+
+def next_page_token(page):
+    """Returns the token that resumes right after the last row of a page"""
+    if not page:
+        return None
+    return encode_page_token(row_user_id(page[-1]))
+
+
+class FileCheckpoint:
+    """Keeps the resume token of a long scan in a small local file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Returns the saved resume token, or None to start from scratch"""
+        try:
+            with open(self.path) as checkpoint:
+                return checkpoint.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def save(self, token):
+        """Atomically replaces the saved resume token"""
+        partial = f"{self.path}.tmp"
+        with open(partial, 'w') as checkpoint:
+            checkpoint.write(token)
+        os.replace(partial, self.path)
+
+    def clear(self):
+        """Forgets the resume token once a scan has finished"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class SQLiteCheckpoint:
+    """Keeps named resume tokens in a local SQLite database"""
+
+    def __init__(self, path, name='stream_users'):
+        self.path = path
+        self.name = name
+        with sqlite3.connect(self.path) as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    name TEXT PRIMARY KEY,
+                    token TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def load(self):
+        """Returns the saved resume token, or None to start from scratch"""
+        with sqlite3.connect(self.path) as db:
+            row = db.execute("SELECT token FROM checkpoints WHERE name = ?",
+                             (self.name,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, token):
+        """Replaces the saved resume token"""
+        with sqlite3.connect(self.path) as db:
+            db.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)",
+                       (self.name, token, time.time()))
+
+    def clear(self):
+        """Forgets the resume token once a scan has finished"""
+        with sqlite3.connect(self.path) as db:
+            db.execute("DELETE FROM checkpoints WHERE name = ?", (self.name,))
+
+
+def build_select(columns=None, where=None, keyset=False, after=None,
+                 limit=None, offset=None, int_age=False):
+    """
+    Builds a parameterized SELECT over user_data and returns (sql, params).
+    columns projects a subset of USER_COLUMNS and where is a small filter
+    such as {'age__gt': 25, 'email__like': '%@example.com'}; a bare column
+    name means equality. keyset=True orders by user_id (always projected
+    first) and after, when given, only keeps rows with user_id > after.
+    int_age=True returns ages as int even from a DECIMAL column.
+    """
+    keyset = keyset or after is not None
+    cast_age = age_sql(int_age) != "age"
+    if columns is None and not uses_binary_ids() and not cast_age:
+        projection = "*"
+    else:
+        columns = list(USER_COLUMNS if columns is None else columns)
+        if keyset:
+            columns = ['user_id'] + [column for column in columns
+                                     if column != 'user_id']
+        for column in columns:
+            if column not in USER_COLUMNS:
+                raise ValueError(f"Unknown user_data column: {column}")
+        expressions = {
+            'user_id': user_id_sql(),
+            'age': age_sql(int_age),
+        }
+        projection = ", ".join(
+            column if expressions.get(column, column) == column
+            else f"{expressions[column]} AS {column}" for column in columns)
+
+    clauses = []
+    params = []
+    for key, value in (where or {}).items():
+        column, _, op = key.partition('__')
+        if column not in USER_COLUMNS:
+            raise ValueError(f"Unknown user_data column: {column}")
+        if op and op not in FILTER_OPERATORS:
+            raise ValueError(f"Unknown filter operator: {op}")
+        placeholder = user_id_param() if column == 'user_id' else "%s"
+        if op == 'in':
+            values = list(value)
+            if not values:
+                # IN () is a syntax error; an empty list matches nothing.
+                clauses.append("1 = 0")
+                continue
+            placeholders = ", ".join([placeholder] * len(values))
+            clauses.append(f"{column} IN ({placeholders})")
+            params.extend(values)
+        else:
+            clauses.append(
+                f"{column} {FILTER_OPERATORS[op or 'eq']} {placeholder}")
+            params.append(value)
+    if after is not None:
+        clauses.append(f"user_id > {user_id_param()}")
+        params.append(after)
+
+    sql = f"SELECT {projection} FROM user_data"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    if keyset:
+        # Qualified, so a BIN_TO_UUID(user_id) AS user_id alias can't shadow
+        # the primary key and force a filesort.
+        sql += " ORDER BY user_data.user_id"
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+        if offset is not None:
+            sql += " OFFSET %s"
+            params.append(offset)
+    return sql, params
+
+
+def fetch_page_after(cursor, page_size, last_seen=None, columns=None,
+                     where=None, row_format='dict', int_age=False):
+    """
+    Fetches the page of users that follows last_seen in user_id order.
+    Seeks through the primary key instead of skipping OFFSET rows, so every
+    page costs the same no matter how deep into the table it is.
+    columns and where are pushed down as in build_select; cursor must come
+    from row_cursor with the same row_format.
+    """
+    sql, params = build_select(columns, where, keyset=True, after=last_seen,
+                               limit=page_size, int_age=int_age)
+    cursor.execute(sql, params)
+    return convert_rows(cursor.fetchall(), row_format)
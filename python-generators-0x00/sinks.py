@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+"""
+Output sinks for the batch processors.
+
+A sink receives whole batches of rows, serializes each batch in one go and
+hands the result to the underlying stream in large blocks, instead of one
+print() (repr, write and flush) per row.
+"""
+import csv
+import io
+import json
+import sys
+from decimal import Decimal
+
+BUFFER_SIZE = 1 << 20
+
+
+def _json_default(value):
+    """Encodes the Decimal ages the MySQL driver returns."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() \
+            else float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def as_dict(row):
+    """Returns any of the generator row formats as a plain dict."""
+    if isinstance(row, dict):
+        return row
+    if hasattr(row, '_asdict'):
+        return row._asdict()
+    if hasattr(row, '__slots__'):
+        return {field: getattr(row, field) for field in row.__slots__}
+    raise TypeError(f"Cannot turn {type(row).__name__} rows into dicts")
+
+
+class BufferedSink:
+    """
+    Base class for sinks that write text to a stream or a file path.
+    Serialized batches are collected until buffer_size characters are
+    pending and then written with a single call.
+    """
+
+    def __init__(self, target=None, buffer_size=BUFFER_SIZE):
+        """Writes to target: an open text stream, a path, or stdout."""
+        if isinstance(target, str):
+            self.stream = open(target, 'w', newline='')
+            self._owns_stream = True
+        else:
+            self.stream = target if target is not None else sys.stdout
+            self._owns_stream = False
+        self.buffer_size = buffer_size
+        self._pending = []
+        self._pending_size = 0
+
+    def serialize(self, rows):
+        """Returns a batch of rows as one string."""
+        raise NotImplementedError
+
+    def write_batch(self, rows):
+        """Serializes a batch and writes it once enough text is pending."""
+        if not rows:
+            return
+        text = self.serialize(rows)
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Writes all pending text to the stream in one block."""
+        if self._pending:
+            self.stream.write("".join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+        self.stream.flush()
+
+    def close(self):
+        """Flushes the sink and closes a file it opened itself."""
+        self.flush()
+        if self._owns_stream:
+            self.stream.close()
+
+    def __enter__(self):
+        """Returns the sink itself."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Closes the sink."""
+        self.close()
+
+
+class JsonLinesSink(BufferedSink):
+    """Writes one JSON object per row (JSON Lines)."""
+
+    def __init__(self, target=None, buffer_size=BUFFER_SIZE):
+        """Writes to target: an open text stream, a path, or stdout."""
+        super().__init__(target, buffer_size)
+        self._encoder = json.JSONEncoder(default=_json_default)
+
+    def serialize(self, rows):
+        """Returns the batch as newline-terminated JSON objects."""
+        encode = self._encoder.encode
+        return "".join([encode(as_dict(row)) + "\n" for row in rows])
+
+
+class CsvSink(BufferedSink):
+    """Writes rows as CSV, with a header taken from the first row."""
+
+    def __init__(self, target=None, buffer_size=BUFFER_SIZE, header=True):
+        """Writes to target: an open text stream, a path, or stdout."""
+        super().__init__(target, buffer_size)
+        self._header = header
+
+    def serialize(self, rows):
+        """Returns the batch as CSV lines."""
+        rows = [as_dict(row) for row in rows]
+        text = io.StringIO()
+        writer = csv.DictWriter(text, fieldnames=list(rows[0]))
+        if self._header:
+            writer.writeheader()
+            self._header = False
+        writer.writerows(rows)
+        return text.getvalue()
+
+
+class CallbackSink:
+    """Hands every batch to a callback, e.g. to load it elsewhere."""
+
+    def __init__(self, callback):
+        """Calls callback(rows) once per batch."""
+        self.callback = callback
+
+    def write_batch(self, rows):
+        """Passes the batch to the callback."""
+        if rows:
+            self.callback(rows)
+
+    def flush(self):
+        """Nothing is buffered."""
+
+    def close(self):
+        """Nothing to release."""
+
+    def __enter__(self):
+        """Returns the sink itself."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Closes the sink."""
+        self.close()
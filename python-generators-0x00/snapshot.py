@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+"""
+Columnar, memory-mapped snapshots of the user_data table.
+
+A snapshot directory holds one file per column: ages as a fixed-width
+int32 array, and every string column as an int64 offsets array plus a
+UTF-8 blob. UserSnapshot maps those files read-only and serves the same
+generator APIs as the database-backed modules without touching MySQL.
+"""
+import json
+import mmap
+import os
+from array import array
+
+META_FILE = "meta.json"
+AGE_FILE = "age.i32"
+STRING_COLUMNS = ('user_id', 'name', 'email')
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotWriter:
+    """Appends (user_id, name, email, age) rows to a snapshot directory."""
+
+    def __init__(self, directory):
+        """Creates the directory and opens one output file per column.
+        An existing meta.json is removed first, so a snapshot being
+        rewritten reads as incomplete until close() succeeds."""
+        os.makedirs(directory, exist_ok=True)
+        try:
+            os.remove(os.path.join(directory, META_FILE))
+        except FileNotFoundError:
+            pass
+        self.directory = directory
+        self.rows = 0
+        self._ages = open(os.path.join(directory, AGE_FILE), 'wb')
+        self._blobs = {}
+        self._offsets = {}
+        self._positions = {}
+        for column in STRING_COLUMNS:
+            self._blobs[column] = open(
+                os.path.join(directory, f"{column}.bin"), 'wb')
+            self._offsets[column] = open(
+                os.path.join(directory, f"{column}.off"), 'wb')
+            self._positions[column] = 0
+            array('q', [0]).tofile(self._offsets[column])
+
+    def write_rows(self, rows):
+        """Appends a chunk of rows, one column file at a time."""
+        if not rows:
+            return
+        array('i', (int(row[3]) for row in rows)).tofile(self._ages)
+        for index, column in enumerate(STRING_COLUMNS):
+            encoded = [str(row[index]).encode() for row in rows]
+            offsets = array('q')
+            position = self._positions[column]
+            for value in encoded:
+                position += len(value)
+                offsets.append(position)
+            self._blobs[column].write(b"".join(encoded))
+            offsets.tofile(self._offsets[column])
+            self._positions[column] = position
+        self.rows += len(rows)
+
+    def close(self, complete=True):
+        """Flushes every column and, when complete, writes the metadata
+        that marks the snapshot as complete. The metadata goes through a
+        temporary file, so a reader never sees half of it."""
+        for handle in [self._ages, *self._blobs.values(),
+                       *self._offsets.values()]:
+            handle.close()
+        if not complete:
+            return
+        path = os.path.join(self.directory, META_FILE)
+        with open(f"{path}.tmp", 'w') as meta:
+            json.dump({
+                'version': SNAPSHOT_VERSION,
+                'rows': self.rows,
+                'columns': [*STRING_COLUMNS, 'age'],
+            }, meta)
+        os.replace(f"{path}.tmp", path)
+
+    def __enter__(self):
+        """Returns the writer itself."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Closes the writer, completing the snapshot unless the export
+        raised."""
+        self.close(complete=exc_type is None)
+
+
+class UserSnapshot:
+    """Read-only, memory-mapped view of a snapshot directory."""
+
+    def __init__(self, directory):
+        """Maps every column file of the snapshot into memory."""
+        with open(os.path.join(directory, META_FILE)) as meta:
+            self.meta = json.load(meta)
+        self.rows = self.meta['rows']
+        self._maps = []
+        self.ages = self._map(os.path.join(directory, AGE_FILE)).cast('i')
+        self._blobs = {}
+        self._offsets = {}
+        for column in STRING_COLUMNS:
+            self._blobs[column] = self._map(
+                os.path.join(directory, f"{column}.bin"))
+            self._offsets[column] = self._map(
+                os.path.join(directory, f"{column}.off")).cast('q')
+
+    def _map(self, path):
+        """Returns a zero-copy memoryview over the file at path."""
+        with open(path, 'rb') as handle:
+            if os.fstat(handle.fileno()).st_size == 0:
+                return memoryview(b"")
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped)
+
+    def __len__(self):
+        """Returns the number of users in the snapshot."""
+        return self.rows
+
+    def value(self, column, index):
+        """Decodes one string column value of row index."""
+        offsets = self._offsets[column]
+        return str(self._blobs[column][offsets[index]:offsets[index + 1]],
+                   'utf-8')
+
+    def user(self, index):
+        """Returns row index as a dict shaped like a user_data row."""
+        return {
+            'user_id': self.value('user_id', index),
+            'name': self.value('name', index),
+            'email': self.value('email', index),
+            'age': self.ages[index],
+        }
+
+    def stream_users(self):
+        """Generator that yields every user as a dict."""
+        for index in range(self.rows):
+            yield self.user(index)
+
+    def stream_users_in_batches(self, batch_size):
+        """Generator that yields users in lists of batch_size."""
+        for start in range(0, self.rows, batch_size):
+            stop = min(start + batch_size, self.rows)
+            yield [self.user(index) for index in range(start, stop)]
+
+    def lazy_pagination(self, page_size):
+        """Generator that yields pages of users, built only when needed."""
+        yield from self.stream_users_in_batches(page_size)
+
+    def stream_user_ages(self):
+        """Generator that yields ages straight from the mapped array."""
+        yield from self.ages
+
+    def compute_average_age(self):
+        """Returns the average age, or None for an empty snapshot."""
+        if not self.rows:
+            return None
+        return sum(self.ages) / self.rows
+
+    def close(self):
+        """Releases the memory maps."""
+        self.ages.release()
+        for view in [*self._blobs.values(), *self._offsets.values()]:
+            view.release()
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+    def __enter__(self):
+        """Returns the snapshot itself."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Closes the snapshot."""
+        self.close()
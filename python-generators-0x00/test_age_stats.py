@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Tests for the incrementally maintained AgeStats in age_stats.py.
+"""
+import importlib
+import statistics
+import unittest
+from contextlib import contextmanager
+from decimal import Decimal
+from unittest.mock import Mock, patch
+
+import seed
+from age_stats import AgeStats
+
+AGES = [18, 25, 25, 31, 42, 42, 42, 57, 64, 80]
+
+
+class TestAgeStats(unittest.TestCase):
+    """
+    Tests the running count, mean, variance and histogram of AgeStats.
+    """
+
+    def assertMatches(self, stats, ages):
+        """Checks stats against the population statistics of ages."""
+        self.assertEqual(stats.count, len(ages))
+        self.assertAlmostEqual(stats.mean, statistics.fmean(ages))
+        self.assertAlmostEqual(stats.variance, statistics.pvariance(ages))
+        self.assertAlmostEqual(stats.stddev, statistics.pstdev(ages))
+
+    def test_empty(self):
+        """
+        Test that statistics without data report None, and that an empty
+        batch changes nothing.
+        """
+        stats = AgeStats()
+        stats.update([])
+        self.assertEqual(stats.count, 0)
+        self.assertIsNone(stats.variance)
+        self.assertIsNone(stats.stddev)
+        self.assertIsNone(stats.quantile(0.5))
+
+    def test_update_in_batches(self):
+        """
+        Test that folding ages in batch by batch gives the same numbers as
+        computing them over all ages at once.
+        """
+        stats = AgeStats()
+        for start in range(0, len(AGES), 3):
+            stats.update(AGES[start:start + 3])
+        self.assertMatches(stats, AGES)
+        self.assertEqual(stats.histogram[42], 3)
+
+    def test_update_rounds_like_decimal_column(self):
+        """
+        Test that fractional ages are rounded half up to whole years, as a
+        scale-0 DECIMAL column stores them.
+        """
+        stats = AgeStats()
+        stats.update([Decimal("24.5"), 30.4, "19"])
+        self.assertEqual(stats.histogram, {25: 1, 30: 1, 19: 1})
+
+    def test_from_histogram(self):
+        """
+        Test that statistics derived from a histogram match the ones folded
+        in row by row, and that an empty histogram gives empty statistics.
+        """
+        histogram = {}
+        for age in AGES:
+            histogram[age] = histogram.get(age, 0) + 1
+        self.assertMatches(AgeStats.from_histogram(histogram), AGES)
+        self.assertEqual(AgeStats.from_histogram({}).count, 0)
+
+    def test_quantile(self):
+        """
+        Test that quantile returns the smallest age with at least q of the
+        users at or below it.
+        """
+        stats = AgeStats()
+        stats.update(AGES)
+        self.assertEqual(stats.quantile(0), 18)
+        self.assertEqual(stats.quantile(0.1), 18)
+        self.assertEqual(stats.quantile(0.25), 25)
+        self.assertEqual(stats.quantile(0.5), 42)
+        self.assertEqual(stats.quantile(0.75), 57)
+        self.assertEqual(stats.quantile(1), 80)
+
+    def test_dict_round_trip(self):
+        """
+        Test that to_dict and from_dict restore the same statistics.
+        """
+        stats = AgeStats()
+        stats.update(AGES)
+        restored = AgeStats.from_dict(stats.to_dict())
+        self.assertMatches(restored, AGES)
+        self.assertEqual(restored.histogram, stats.histogram)
+
+
+class TestAverageAgeStats(unittest.TestCase):
+    """
+    Tests how 4-stream_ages reads the saved statistics.
+    """
+
+    def setUp(self):
+        """Routes pooled connections to a mock connection."""
+        self.stream_ages = importlib.import_module('4-stream_ages')
+        self.connection = Mock()
+
+        @contextmanager
+        def pooled_connection():
+            yield self.connection
+
+        patcher = patch.object(seed, 'pooled_connection', pooled_connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_falls_back_without_stats_table(self):
+        """
+        Test that a database without user_data_stats gets the pushdown
+        aggregate instead of an error.
+        """
+        with patch.object(seed, 'has_table', return_value=False), \
+                patch.object(AgeStats, 'current') as current, \
+                patch.object(self.stream_ages, 'average_age_pushdown',
+                             return_value=(2, 30.0)):
+            self.assertEqual(self.stream_ages.average_age_stats(), (2, 30.0))
+        current.assert_not_called()
+
+    def test_reads_saved_stats(self):
+        """
+        Test that the saved statistics are used when the table exists.
+        """
+        stats = AgeStats()
+        stats.update([20, 40])
+        with patch.object(seed, 'has_table', return_value=True), \
+                patch.object(AgeStats, 'current', return_value=stats):
+            self.assertEqual(self.stream_ages.average_age_stats(), (2, 30.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Tests for the external-memory sort and group-by in external_sort.py.
+"""
+import random
+import unittest
+from unittest.mock import patch
+
+import external_sort
+from external_sort import by_age, by_email_domain, external_sort as sort
+
+
+def users(count, seed=0):
+    """Returns `count` synthetic users with repeated ages and domains."""
+    generator = random.Random(seed)
+    domains = ['example.com', 'Example.org', 'mail.net']
+    return [{'index': index, 'age': generator.randint(18, 30),
+             'email': f"user{index}@{generator.choice(domains)}"}
+            for index in range(count)]
+
+
+class TestExternalSort(unittest.TestCase):
+    """
+    Tests that external_sort matches sorted() while spilling runs to disk.
+    """
+
+    def test_fits_in_memory(self):
+        """
+        Test that input smaller than run_size is sorted without spilling.
+        """
+        with patch.object(external_sort, '_spill') as spill:
+            self.assertEqual(list(sort([3, 1, 2])), [1, 2, 3])
+        spill.assert_not_called()
+        self.assertEqual(list(sort([])), [])
+
+    def test_matches_sorted_and_is_stable(self):
+        """
+        Test that spilled runs merge back in key order, equal keys keeping
+        their input order, in both directions.
+        """
+        data = users(5000)
+        for reverse in (False, True):
+            with self.subTest(reverse=reverse):
+                self.assertEqual(
+                    list(sort(data, key=by_age, reverse=reverse,
+                              run_size=37)),
+                    sorted(data, key=by_age, reverse=reverse))
+
+    def test_merges_by_level(self):
+        """
+        Test that with a small fan-in every item is rewritten once per
+        level, not once per merge: 64 runs of fan-in 4 take 16 + 4 + 1
+        merges, and at most MAX_FAN_IN runs are ever merged at once.
+        """
+        merges = []
+        merge_runs = external_sort._merge_runs
+
+        def counting(runs, key, reverse):
+            merges.append(len(runs))
+            return merge_runs(runs, key, reverse)
+
+        data = list(range(640, 0, -1))
+        with patch.object(external_sort, 'MAX_FAN_IN', 4), \
+                patch.object(external_sort, '_merge_runs', counting):
+            self.assertEqual(list(sort(data, run_size=10)), sorted(data))
+        self.assertEqual(len(merges), 16 + 4 + 1)
+        self.assertTrue(all(count <= 4 for count in merges))
+
+    def test_final_merge_fan_in(self):
+        """
+        Test that runs left over on several levels are reduced so the final
+        merge never reads more than MAX_FAN_IN runs at once.
+        """
+        fan_ins = []
+        merge = external_sort.heapq.merge
+
+        def counting(*runs, **kwargs):
+            fan_ins.append(len(runs))
+            return merge(*runs, **kwargs)
+
+        # 47 runs leave 2 + 3 + 3 runs on three levels at the end.
+        data = users(470)
+        with patch.object(external_sort, 'MAX_FAN_IN', 4), \
+                patch.object(external_sort.heapq, 'merge', counting):
+            result = list(sort(data, key=by_age, run_size=10))
+        self.assertEqual(result, sorted(data, key=by_age))
+        self.assertLessEqual(max(fan_ins), 4)
+
+    def test_closing_early_closes_runs(self):
+        """
+        Test that abandoning the generator closes every spilled run.
+        """
+        spilled = []
+        spill = external_sort._spill
+
+        def tracking(items):
+            run = spill(items)
+            spilled.append(run)
+            return run
+
+        with patch.object(external_sort, '_spill', tracking):
+            sorted_items = sort(range(100, 0, -1), run_size=10)
+            self.assertEqual(next(sorted_items), 1)
+            sorted_items.close()
+        self.assertTrue(spilled)
+        self.assertTrue(all(run.closed for run in spilled))
+
+
+class TestGroupBy(unittest.TestCase):
+    """
+    Tests for group_by and its sort keys.
+    """
+
+    def test_group_by_domain(self):
+        """
+        Test that users are grouped by lowercased email domain in key order.
+        """
+        data = users(300)
+        groups = {domain: [user['index'] for user in group]
+                  for domain, group in external_sort.group_by(
+                      data, by_email_domain, run_size=16)}
+        self.assertEqual(list(groups), ['example.com', 'example.org',
+                                        'mail.net'])
+        for domain, indexes in groups.items():
+            self.assertEqual(indexes, [user['index'] for user in data
+                                       if by_email_domain(user) == domain])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Memory-ceiling tests for the streaming user_data generators.
+
+A mocked unbuffered cursor serves a large synthetic table chunk by chunk,
+and tracemalloc checks that draining the generators never holds more than
+a few chunks in memory, however many rows go by.
+"""
+import importlib
+import tracemalloc
+import unittest
+from contextlib import contextmanager
+from unittest.mock import Mock, patch
+
+import seed
+
+TABLE_ROWS = 100000
+CHUNK_SIZE = 500
+# A few chunks of dict rows; the whole table would be tens of MiB.
+MEMORY_CEILING = 2 * 1024 * 1024
+
+
+class SyntheticCursor:
+    """
+    Unbuffered-cursor stand-in that builds rows only when fetched, so the
+    table itself costs no memory.
+    """
+
+    def __init__(self, rows, dictionary=True):
+        """Serves `rows` synthetic users, as dicts or tuples."""
+        self.rows = rows
+        self.dictionary = dictionary
+        self.position = 0
+        self.fetch_sizes = []
+        self.execute = Mock()
+        self.close = Mock()
+
+    def _row(self, index):
+        """Builds the user_data row at index."""
+        row = (f"{index:08d}-0000-7000-8000-000000000000",
+               f"User {index}", f"user{index}@example.com", 18 + index % 80)
+        return dict(zip(seed.USER_COLUMNS, row)) if self.dictionary else row
+
+    def fetchmany(self, size):
+        """Returns the next `size` rows, or [] once the table is done."""
+        self.fetch_sizes.append(size)
+        stop = min(self.position + size, self.rows)
+        rows = [self._row(index) for index in range(self.position, stop)]
+        self.position = stop
+        return rows
+
+
+def peak_memory(rows):
+    """Drains an iterable one row at a time and returns how many rows it
+    yielded and the peak traced memory in bytes."""
+    tracemalloc.start()
+    try:
+        count = 0
+        for _ in rows:
+            count += 1
+        return count, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class TestStreamUsersMemory(unittest.TestCase):
+    """
+    Tests that streaming user_data keeps memory bounded by the chunk size.
+    """
+
+    def setUp(self):
+        """Resets the cached schema so build_select uses the defaults."""
+        patcher = patch.object(seed, '_column_types', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_seed_stream_users(self):
+        """
+        Test that seed.stream_users reads CHUNK_SIZE rows per fetch and
+        stays under MEMORY_CEILING over the whole table.
+        """
+        cursor = SyntheticCursor(TABLE_ROWS)
+        connection = Mock()
+        connection.cursor.return_value = cursor
+
+        count, peak = peak_memory(seed.stream_users(connection, CHUNK_SIZE))
+
+        self.assertEqual(count, TABLE_ROWS)
+        self.assertLess(peak, MEMORY_CEILING)
+        connection.cursor.assert_called_once_with(dictionary=True,
+                                                  buffered=False)
+        self.assertEqual(set(cursor.fetch_sizes), {CHUNK_SIZE})
+
+    def test_pooled_stream_users(self):
+        """
+        Test that 0-stream_users.stream_users streams through a pooled
+        connection under MEMORY_CEILING, in every row format.
+        """
+        stream_users = importlib.import_module('0-stream_users').stream_users
+        for row_format in seed.ROW_FORMATS:
+            with self.subTest(row_format=row_format):
+                cursor = SyntheticCursor(TABLE_ROWS,
+                                         dictionary=row_format == 'dict')
+                connection = Mock()
+                connection.cursor.return_value = cursor
+
+                @contextmanager
+                def pooled_connection():
+                    yield connection
+
+                with patch.object(seed, 'pooled_connection',
+                                  pooled_connection):
+                    count, peak = peak_memory(stream_users(
+                        CHUNK_SIZE, row_format=row_format))
+
+                self.assertEqual(count, TABLE_ROWS)
+                self.assertLess(peak, MEMORY_CEILING)
+                cursor.close.assert_called_once_with()
+
+    def test_buffering_would_break_the_ceiling(self):
+        """
+        Test that the ceiling is meaningful: holding the whole table, as a
+        buffered fetchall would, goes well over MEMORY_CEILING.
+        """
+        cursor = SyntheticCursor(TABLE_ROWS)
+
+        def buffered():
+            yield from cursor.fetchmany(TABLE_ROWS)
+
+        count, peak = peak_memory(buffered())
+
+        self.assertEqual(count, TABLE_ROWS)
+        self.assertGreater(peak, 10 * MEMORY_CEILING)
+
+
+if __name__ == '__main__':
+    unittest.main()